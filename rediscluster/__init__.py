@@ -9,12 +9,22 @@ from redis.exceptions import (
     WatchError,
 )
 
+from rediscluster.client_cache import ClientCache
 from rediscluster.cluster_client import StrictRedisCluster
+from rediscluster.cluster_pipeline import StrictClusterPipeline, StrictClusterTransaction
+from rediscluster.partitioners import (
+    KetamaPartitioner,
+    ModuloPartitioner,
+    SlotPartitioner,
+)
+from rediscluster.pools import PoolRegistry
+from rediscluster.scripts import ClusterScript
 
 __version__ = '0.5.3'
 VERSION = tuple(map(int, __version__.split('.')))
 
 __all__ = [
-    'StrictRedisCluster', 'RedisError', 'ConnectionError', 'ResponseError', 'AuthenticationError',
+    'StrictRedisCluster', 'StrictClusterPipeline', 'StrictClusterTransaction',
+    'ModuloPartitioner', 'KetamaPartitioner', 'SlotPartitioner', 'PoolRegistry', 'ClientCache', 'ClusterScript', 'RedisError', 'ConnectionError', 'ResponseError', 'AuthenticationError',
     'InvalidResponse', 'DataError', 'PubSubError', 'WatchError'
 ]
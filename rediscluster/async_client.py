@@ -0,0 +1,498 @@
+# -*- coding: UTF-8 -*-
+import asyncio
+
+import redis
+from redis._compat import b, basestring, bytes, iteritems, itervalues
+from redis.client import list_or_args
+
+import aioredis
+from aioredis.exceptions import RedisError as AsyncRedisError
+
+from rediscluster.cluster_client import BaseRedisCluster, Topology, _replicas
+from rediscluster.cluster_pipeline import StrictClusterPipeline
+from rediscluster.partitioners import ModuloPartitioner
+from rediscluster.replicas import ReplicaSet
+
+
+class AsyncStrictRedisCluster(BaseRedisCluster):
+    """
+    Implementation of the Redis Cluster Client using asyncio redis clients
+
+    Keys are routed exactly like with StrictRedisCluster (same partitioners,
+    hash tags, reads on slaves and writes on masters) but all the commands
+    are coroutines, and the commands involving many nodes are sent to all of
+    them at the same time with asyncio.gather.
+    The servers are connected to and discovered by ``initialize``:
+
+        r = await AsyncStrictRedisCluster(cluster=cluster).initialize()
+
+    """
+
+    def __init__(self, cluster={}, db=0, mastersonly=False, node_timeout=None,
+                 partitioner=ModuloPartitioner, route_cache_size=0, connect_timeout=None):
+        # raise exception when wrong server hash
+        if 'nodes' not in cluster:
+            raise Exception(
+                "rediscluster: Please set a correct array of redis cluster.")
+
+        self.topology = Topology(cluster, partitioner, route_cache_size)
+        self.db = db
+        self.mastersonly = mastersonly
+        self.max_workers = None
+        self.node_timeout = node_timeout
+        self.connect_timeout = connect_timeout
+
+    async def __aenter__(self):
+        return await self.initialize()
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def initialize(self):
+        "Connect to all the masters and discover their slaves at the same time"
+        have_master_of = 'master_of' in self.cluster
+        aliases = {}
+        for alias, server in iteritems(self.cluster['nodes']):
+            if have_master_of and alias not in self.cluster['master_of']:
+                continue
+            aliases.setdefault(str(server), []).append(alias)
+
+        replies = await self._execute_parallel(dict(
+            (server_str, (self._connect, (server_aliases[0], have_master_of)))
+            for server_str, server_aliases in iteritems(aliases)), raise_on_error=False, timeout=self.connect_timeout)
+
+        errors = [str(res) for res in itervalues(replies) if isinstance(res, Exception)]
+        if errors:
+            raise redis.ConnectionError("; ".join(sorted(errors)))
+
+        self.cluster['slaves'] = {}
+        for server_str, (master, slave, slave_node) in iteritems(replies):
+            for alias in aliases[server_str]:
+                self.redises[alias] = master
+                self.redises[alias + '_slave'] = slave
+                self.cluster['slaves'][alias + '_slave'] = slave_node
+        return self
+
+    async def _connect(self, alias, have_master_of):
+        """
+        Connect to the master ``alias`` and to its slaves, return the master
+        and slaves clients and the slave configuration
+        """
+        server = self.cluster['nodes'][alias]
+        try:
+            master = aioredis.StrictRedis(db=self.db, **server)
+            info = {}
+            if not self.mastersonly and not have_master_of:
+                info = await master.info()
+                if info['role'] != 'master':
+                    raise redis.DataError(
+                        "rediscluster: server %s is not a master." % (server,))
+        except (redis.RedisError, AsyncRedisError) as e:
+            raise redis.ConnectionError(
+                "rediscluster cannot connect to: %s %s" % (server, e))
+
+        slaves = []
+        if not self.mastersonly:
+            if have_master_of:
+                names = self.cluster['master_of'][alias]
+                if isinstance(names, (basestring, bytes)):
+                    names = [names]
+                slaves = [(self.cluster['nodes'][name], self.cluster['nodes'][name]) for name in names]
+            else:
+                # the slaves are set up as their master, e.g. timeouts and password
+                slaves = [(slave, dict(server, host=slave['host'], port=int(slave['port']), unix_socket_path=None))
+                          for slave in self._getslavesfrominfo(info)]
+
+        if not slaves:
+            return master, master, server
+        replicas = [aioredis.StrictRedis(db=self.db, **options) for slave, options in slaves]
+        # the reads of a node reading from several slaves are spread over them in turn
+        readers = replicas[0] if len(replicas) == 1 else ReplicaSet(replicas)
+        return master, readers, {'host': slaves[0][0]['host'], 'port': slaves[0][0]['port']}
+
+    async def close(self):
+        "Close the connections to all the redis servers"
+        redisents = dict(
+            (id(server), server) for redisent in itervalues(self.redises) for server in _replicas(redisent))
+        await asyncio.gather(*[redisent.close() for redisent in itervalues(redisents)])
+
+    def _build_command(self, name):
+        """
+        Return the coroutine function sending the command ``name`` to the
+        cluster, resolving once how the command has to be routed
+        """
+        cls = self.__class__
+        rc_command = getattr(cls, '_rc_' + name, None)
+
+        async def not_supported(self, *args, **kwargs):
+            raise redis.DataError("rediscluster: Command %s Not Supported (each key name has its own node)" % name)
+
+        if name in cls._loop_keys:
+            # take care of keys that don't need to go through master and slaves redis servers
+            if name in cls._loop_keys_admin:
+                async def command(self, *args, **kwargs):
+                    return await self._execute_admin(name, *args, **kwargs)
+            elif rc_command is not None:
+                async def command(self, *args, **kwargs):
+                    return await rc_command(self, *args, **kwargs)
+            else:
+                command = not_supported
+            return command
+
+        if name in cls._multi_keys and rc_command is not None:
+            async def command(self, *args, **kwargs):
+                return await rc_command(self, *args, **kwargs)
+            return command
+
+        is_write = name in cls._write_keys
+        is_read = name in cls._read_keys
+        is_tag = name in cls._tag_keys
+
+        async def command(self, *args, **kwargs):
+            # take care of hash tags
+            hkey, tag_start, tagged_args = self._parse_hash_tag(args)
+
+            # trigger error msg on tag keys unless we have hash tags e.g. "bar{zap}"
+            if is_tag and not tag_start:
+                if rc_command is None:
+                    return await not_supported(self)
+                return await rc_command(self, *args, **kwargs)
+
+            if is_write:
+                redisent = self.redises[self._getnodenamefor(hkey)]
+            elif is_read:
+                redisent = self.redises[self._slave_aliases[self._getnodenamefor(hkey)]]
+            else:
+                return await not_supported(self)
+
+            # Execute the command on the server
+            return await getattr(redisent, name)(*tagged_args, **kwargs)
+
+        return command
+
+    async def _execute_parallel(self, calls, raise_on_error=True, timeout=None):
+        """
+        Execute the ``calls`` dict of key: (coroutine function, args) at the
+        same time and return a dict of key: result.
+        A call that hasn't returned after ``timeout`` seconds (``node_timeout``
+        by default) fails with a ConnectionError. The first error is raised once all the calls are
+        done, unless ``raise_on_error`` is False, in which case the exception
+        is returned as the result of the call that failed.
+        """
+        keys = list(calls)
+        coros = [calls[k][0](*calls[k][1]) for k in keys]
+        timeout = timeout or self.node_timeout
+        if timeout:
+            coros = [asyncio.wait_for(coro, timeout) for coro in coros]
+        replies = await asyncio.gather(*coros, return_exceptions=True)
+
+        results = {}
+        errors = []
+        for k, res in zip(keys, replies):
+            if isinstance(res, asyncio.TimeoutError):
+                res = redis.ConnectionError(
+                    "rediscluster: %s did not reply within %s seconds" % (k, timeout))
+            if isinstance(res, Exception):
+                errors.append(res)
+            results[k] = res
+
+        if errors and raise_on_error:
+            raise errors[0]
+        return results
+
+    async def _execute_admin(self, name, *args, **kwargs):
+        """
+        Execute the admin command ``name`` on all the redis servers at the same
+        time and return a dict of alias: result. A server that fails gets its
+        exception as result, unless all of them fail.
+        """
+        topology = self.topology
+        calls, servers, skipped = topology._admin_calls(name, *args, **kwargs)
+        return topology._admin_result(servers, skipped, await self._execute_parallel(calls, raise_on_error=False))
+
+    async def __getitem__(self, name):
+        """
+        Return the value at key ``name``, raises a KeyError if the key
+        doesn't exist.
+        """
+        value = await self.get(name)
+        if value:
+            return value
+        raise KeyError(name)
+
+    def __setitem__(self, name, value):
+        raise TypeError("rediscluster: use 'await set(name, value)' with the asyncio client")
+
+    def __delitem__(self, *names):
+        raise TypeError("rediscluster: use 'await delete(*names)' with the asyncio client")
+
+    async def object(self, infotype, key):
+        "Return the encoding, idletime, or refcount about the key"
+        redisent = self.redises[self._slave_aliases[self._getnodenamefor(key)]]
+        return await redisent.object(infotype, key)
+
+    def pipeline(self):
+        """
+        Return a new pipeline object that can queue multiple commands for
+        later execution. The commands are grouped by the redis server
+        they land to and all the servers are sent their commands at once.
+        """
+        return AsyncStrictClusterPipeline(self)
+
+    async def scan(self, cursor='0', match=None, count=None, type=None, parallel=False):
+        """
+        Incrementally return lists of key names across all the slaves, one
+        SCAN call per node. Also return a cursor to resume the scan from,
+        '0' once every node has been scanned entirely.
+        See StrictRedisCluster.scan
+        """
+        cursors = self._scan_cursors(cursor)
+        replies = await self._execute_parallel(
+            self._scan_calls(cursors if parallel else cursors[:1], match=match, count=count, type=type))
+        return self._scan_result(cursors, replies)
+
+    async def scan_iter(self, match=None, count=None, type=None, parallel=False, cursor='0'):
+        """
+        Make an asynchronous iterator using the SCAN command on every slave
+        so that the client doesn't need to remember the cursor position.
+        """
+        while True:
+            cursor, data = await self.scan(cursor, match=match, count=count, type=type, parallel=parallel)
+            for item in data:
+                yield item
+            if cursor == '0':
+                break
+
+    async def _rc_brpoplpush(self, src, dst, timeout=0):
+        """
+        Pop a value off the tail of ``src``, push it on the head of ``dst``
+        and then return it.
+
+        This command blocks until a value is in ``src`` or until ``timeout``
+        seconds elapse, whichever is first. A ``timeout`` value of 0 blocks
+        forever.
+        Not atomic
+        """
+        rpop = await self.brpop(src, timeout)
+        if rpop is not None:
+            await self.lpush(dst, rpop[1])
+            return rpop[1]
+        return None
+
+    async def _rc_rpoplpush(self, src, dst):
+        """
+        RPOP a value off of the ``src`` list and LPUSH it
+        on to the ``dst`` list.  Returns the value.
+        """
+        rpop = await self.rpop(src)
+        if rpop is not None:
+            await self.lpush(dst, rpop)
+            return rpop
+        return None
+
+    async def _smembers(self, keys):
+        "Return the list of the members of the sets ``keys``, fetched at the same time"
+        return await asyncio.gather(*[self.smembers(key) for key in keys])
+
+    async def _rc_sdiff(self, src, *args):
+        """
+        Returns the members of the set resulting from the difference between
+        the first set and all the successive sets.
+        """
+        sets = await self._smembers(list_or_args(src, args))
+        src_set = sets[0]
+        for members in sets[1:]:
+            src_set.difference_update(members)
+        return src_set
+
+    async def _rc_sinter(self, src, *args):
+        """
+        Returns the members of the set resulting from the intersection of
+        the first set and all the successive sets.
+        """
+        sets = await self._smembers(list_or_args(src, args))
+        src_set = sets[0]
+        for members in sets[1:]:
+            src_set.intersection_update(members)
+        return src_set
+
+    async def _rc_sunion(self, src, *args):
+        """
+        Returns the members of the set resulting from the union between
+        the first set and all the successive sets.
+        """
+        sets = await self._smembers(list_or_args(src, args))
+        src_set = sets[0]
+        for members in sets[1:]:
+            src_set.update(members)
+        return src_set
+
+    async def _store_set(self, dst, members):
+        "Replace the set ``dst`` by ``members`` and return its size"
+        await self.delete(dst)
+        if members:
+            await self.sadd(dst, *list(members))
+        return len(members)
+
+    async def _rc_sdiffstore(self, dst, src, *args):
+        """
+        Store the difference of sets ``src``,  ``args`` into a new
+        set named ``dest``.  Returns the number of keys in the new set.
+        """
+        return await self._store_set(dst, await self._rc_sdiff(src, *args))
+
+    async def _rc_sinterstore(self, dst, src, *args):
+        """
+        Store the intersection of sets ``src``,  ``args`` into a new
+        set named ``dest``.  Returns the number of keys in the new set.
+        """
+        return await self._store_set(dst, await self._rc_sinter(src, *args))
+
+    async def _rc_sunionstore(self, dst, src, *args):
+        """
+        Store the union of sets ``src``,  ``args`` into a new
+        set named ``dest``.  Returns the number of keys in the new set.
+        """
+        return await self._store_set(dst, await self._rc_sunion(src, *args))
+
+    async def _rc_smove(self, src, dst, value):
+        """
+        Move ``value`` from set ``src`` to set ``dst``
+        not atomic
+        """
+        if await self.type(src) != b("set"):
+            return await self.smove(src + "{" + src + "}", dst, value)
+        if await self.type(dst) != b("set"):
+            return await self.smove(dst + "{" + dst + "}", src, value)
+        if await self.srem(src, value):
+            return 1 if await self.sadd(dst, value) else 0
+        return 0
+
+    async def _rc_mset(self, mapping):
+        "Sets each key in the ``mapping`` dict to its corresponding value"
+        replies = await self._execute_parallel(dict(
+            (alias, (self.redises[alias].mset, (items,)))
+            for alias, items in iteritems(self._split_mapping('mset', mapping))))
+        return all(itervalues(replies))
+
+    async def _rc_msetnx(self, mapping):
+        """
+        Sets each key in the ``mapping`` dict to its corresponding value if
+        none of the keys are already set
+        """
+        mappings = self._split_mapping('msetnx', mapping)
+        if len(mappings) == 1:
+            for alias, items in iteritems(mappings):
+                return await self.redises[alias].msetnx(items)
+
+        async def exists(redisent, names):
+            pipe = redisent.pipeline(transaction=False)
+            for name in names:
+                pipe.exists(name)
+            return await pipe.execute()
+
+        replies = await self._execute_parallel(dict(
+            (alias, (exists, (self.redises[alias], list(items))))
+            for alias, items in iteritems(mappings)))
+        for reply in itervalues(replies):
+            if any(reply):
+                return False
+
+        return await self._rc_mset(mapping)
+
+    async def _rc_mget(self, keys, *args):
+        """
+        Returns a list of values ordered identically to ``*args``
+        """
+        args = list_or_args(keys, args)
+        aliases = self._getaliasesfor('mget', args)
+        replies = await self._execute_parallel(dict(
+            (alias, (self.redises[alias].mget, (names,)))
+            for alias, (positions, names) in iteritems(aliases)))
+        return self._merge(aliases, replies, len(args))
+
+    async def _rc_rename(self, src, dst):
+        """
+        Rename key ``src`` to ``dst``, with RENAME for keys of the same redis
+        server and by moving it with DUMP and RESTORE otherwise
+        """
+        if src == dst:
+            return await self.rename(src + "{" + src + "}", src)
+
+        src_alias, src_name = self._getkeyfor('rename', src)
+        dst_alias, dst_name = self._getkeyfor('rename', dst)
+        src_redis = self.redises[src_alias]
+        dst_redis = self.redises[dst_alias]
+        if src_redis is dst_redis:
+            return await src_redis.rename(src_name, dst_name)
+
+        data, pttl = await asyncio.gather(src_redis.dump(src_name), src_redis.pttl(src_name))
+        if data is None:
+            return await self.rename(src + "{" + src + "}", src)
+
+        await dst_redis.restore(dst_name, pttl if pttl and pttl > 0 else 0, data, replace=True)
+        await src_redis.delete(src_name)
+        return True
+
+    async def _rc_delete(self, *names):
+        "Delete one or more keys specified by ``names``"
+        return await self._delete_keys('DEL', names)
+
+    async def _rc_unlink(self, *names):
+        "Unlink one or more keys specified by ``names``, freeing their memory in the background"
+        return await self._delete_keys('UNLINK', names)
+
+    async def _delete_keys(self, command, names):
+        """
+        Send the ``command``, DEL or UNLINK, of the keys ``names`` to their
+        nodes at the same time and return the number of keys removed
+        """
+        aliases = self._getaliasesfor('delete', names)
+        replies = await self._execute_parallel(dict(
+            (alias, (self.redises[alias].execute_command, [command] + names))
+            for alias, (positions, names) in iteritems(aliases)))
+        return sum(itervalues(replies))
+
+    async def _rc_renamenx(self, src, dst):
+        "Rename key ``src`` to ``dst`` if ``dst`` doesn't already exist"
+        if await self.exists(dst):
+            return False
+
+        return await self._rc_rename(src, dst)
+
+    async def _rc_keys(self, pattern='*'):
+        "Returns a list of keys matching ``pattern``"
+        keys = set()
+        async for key in self.scan_iter(match=pattern, count=1000, parallel=True):
+            keys.add(key)
+        return list(keys)
+
+    async def _rc_dbsize(self):
+        "Returns the number of keys in the current database"
+        replies = await self._execute_parallel(dict(
+            (alias, (redisent.dbsize, ()))
+            for alias, redisent in iteritems(self.redises) if alias.find('_slave') >= 0))
+        return sum(itervalues(replies))
+
+
+class AsyncStrictClusterPipeline(StrictClusterPipeline):
+    """
+    Pipeline for the asyncio cluster client, the pipelines of all the
+    redis servers are executed at the same time
+    """
+
+    async def execute(self, raise_on_error=True):
+        """
+        Send all the buffered commands, one pipeline per redis server,
+        and return their responses in the order they were issued
+        """
+        if not self.command_stack:
+            return []
+
+        pipes, positions = self._pipelines()
+        try:
+            replies = await self.cluster._execute_parallel(dict(
+                (alias, (pipe.execute, (False,))) for alias, pipe in iteritems(pipes)), raise_on_error=False)
+            return self._responses(positions, replies, raise_on_error)
+        finally:
+            self.reset()
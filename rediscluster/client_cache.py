@@ -0,0 +1,214 @@
+# -*- coding: UTF-8 -*-
+import threading
+import time
+from collections import OrderedDict
+
+from redis._compat import basestring, bytes, nativestr
+
+
+INVALIDATE_CHANNEL = '__redis__:invalidate'
+
+
+def encode_key(key):
+    "Return the key name ``key`` as the bytes redis stores it as"
+    if isinstance(key, bytes):
+        return key
+    if not isinstance(key, basestring):
+        key = str(key)
+    return key.encode('utf-8')
+
+
+def written_keys(name, args):
+    "Return the key names written by the command ``name`` called with ``args``"
+    if not args:
+        return []
+    if name in ('delete', 'del', 'unlink'):
+        return list(args)
+    if name in ('rename', 'renamenx', 'smove', 'rpoplpush', 'brpoplpush'):
+        return list(args[:2])
+    if isinstance(args[0], (dict, list, tuple)):
+        return list(args[0])
+    return [args[0]]
+
+
+class ClientCache(object):
+    """
+    Thread safe cache of the replies of read commands
+
+    It holds at most ``maxsize`` replies, for at most ``ttl`` seconds if
+    given, and evicts the least recently used (``lru``) or the least
+    frequently used (``lfu``) reply first according to ``policy``.
+    Only the keys starting with one of ``prefixes`` are cached, if given.
+
+    Every reply is cached with an index, e.g. its node and key name, and
+    dropped when this index is invalidated.
+    """
+
+    POLICIES = ('lru', 'lfu')
+
+    def __init__(self, maxsize=10000, ttl=None, policy='lru', prefixes=()):
+        if policy not in self.POLICIES:
+            raise ValueError("rediscluster: Unknown cache policy %s" % policy)
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.policy = policy
+        self.prefixes = tuple(encode_key(prefix) for prefix in prefixes)
+        # key: [value, expire time, index, frequency]
+        self.entries = {}
+        # frequency: keys of that frequency, the least recently used first
+        self.buckets = {}
+        # index: set of keys
+        self.index = {}
+        # incremented on every invalidation
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def cacheable(self, key):
+        "Return whether the replies of the key name ``key`` can be cached"
+        return not self.prefixes or encode_key(key).startswith(self.prefixes)
+
+    def get(self, key, default=None):
+        "Return the cached reply ``key``, ``default`` if there is none"
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+            if entry[1] is not None and entry[1] <= time.time():
+                self._remove(key)
+                return default
+            bucket = self.buckets[entry[3]]
+            del bucket[key]
+            if self.policy == 'lfu':
+                if not bucket:
+                    del self.buckets[entry[3]]
+                entry[3] += 1
+            self.buckets.setdefault(entry[3], OrderedDict())[key] = True
+            return entry[0]
+
+    def set(self, key, value, index, generation=None):
+        """
+        Cache the reply ``value`` as ``key`` until ``index`` is invalidated.
+        Nothing is cached if an invalidation happened since ``generation``,
+        the value being possibly stale already
+        """
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            if key in self.entries:
+                self._remove(key)
+            elif len(self.entries) >= self.maxsize:
+                self._evict()
+            self.entries[key] = [value, time.time() + self.ttl if self.ttl else None, index, 0]
+            self.buckets.setdefault(0, OrderedDict())[key] = True
+            self.index.setdefault(index, set()).add(key)
+
+    def invalidate(self, indexes):
+        "Drop the replies cached with one of the ``indexes``"
+        with self.lock:
+            self.generation += 1
+            for index in indexes:
+                for key in list(self.index.get(index, ())):
+                    self._remove(key)
+
+    def clear(self):
+        "Drop all the cached replies"
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+            self.buckets.clear()
+            self.index.clear()
+
+    def _remove(self, key):
+        value, expire, index, frequency = self.entries.pop(key)
+        bucket = self.buckets[frequency]
+        del bucket[key]
+        if not bucket:
+            del self.buckets[frequency]
+        keys = self.index[index]
+        keys.discard(key)
+        if not keys:
+            del self.index[index]
+
+    def _evict(self):
+        bucket = self.buckets[min(self.buckets)]
+        self._remove(next(iter(bucket)))
+
+
+class InvalidationListener(threading.Thread):
+    """
+    Thread invalidating the replies of ``cache`` on the keys modified on
+    the redis server of ``redisent``, the master of the list of ``nodes``
+    sharing it
+
+    A first connection subscribes to the __redis__:invalidate channel, a
+    second one turns client tracking on in broadcasting mode (redis >= 6),
+    redirecting the invalidation messages of the keys starting with the
+    prefixes of the cache to the first one. The whole cache is cleared
+    whenever the connections are (re)established.
+    """
+
+    def __init__(self, cache, nodes, redisent, retry_interval=1.0):
+        super(InvalidationListener, self).__init__()
+        self.daemon = True
+        self.cache = cache
+        self.nodes = nodes
+        self.pool = redisent.connection_pool
+        self.retry_interval = retry_interval
+        self.closed = threading.Event()
+        self.ready = threading.Event()
+
+    def close(self):
+        "Stop listening"
+        self.closed.set()
+
+    def run(self):
+        while not self.closed.is_set():
+            try:
+                self.listen()
+            except Exception:
+                pass
+            self.ready.clear()
+            self.cache.clear()
+            self.closed.wait(self.retry_interval)
+
+    def listen(self):
+        "Listen to the invalidation messages until closed or disconnected"
+        pool = self.pool
+        listener = pool.connection_class(**pool.connection_kwargs)
+        tracking = pool.connection_class(**pool.connection_kwargs)
+        try:
+            listener.send_command('CLIENT', 'ID')
+            client_id = listener.read_response()
+            listener.send_command('SUBSCRIBE', INVALIDATE_CHANNEL)
+            listener.read_response()
+
+            args = ['CLIENT', 'TRACKING', 'ON', 'REDIRECT', client_id, 'BCAST']
+            for prefix in self.cache.prefixes:
+                args.extend(['PREFIX', prefix])
+            tracking.send_command(*args)
+            tracking.read_response()
+
+            # replies cached before tracking was on may be stale
+            self.cache.clear()
+            self.ready.set()
+            nodes = self.nodes
+            while not self.closed.is_set():
+                if not listener.can_read(timeout=self.retry_interval):
+                    # tracking stops if its connection is closed, check it is alive
+                    tracking.send_command('PING')
+                    tracking.read_response()
+                    continue
+                message = listener.read_response()
+                if nativestr(message[0]) != 'message':
+                    continue
+                if message[2] is None:
+                    # flushdb / flushall
+                    self.cache.clear()
+                else:
+                    self.cache.invalidate([(node, key) for node in nodes for key in message[2]])
+        finally:
+            listener.disconnect()
+            tracking.disconnect()
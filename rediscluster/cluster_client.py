@@ -1,19 +1,64 @@
 # -*- coding: UTF-8 -*-
-import binascii
+import copy
+import functools
+import json
+import threading
+import time
+import uuid
 
 import redis
 from redis._compat import (
-    b, iteritems, iterkeys, itervalues, basestring, bytes)
+    b, iteritems, iterkeys, itervalues, basestring, bytes, nativestr, Empty, Queue)
 from redis.client import list_or_args
 
+from rediscluster.client_cache import InvalidationListener, encode_key, written_keys
+from rediscluster.cluster_pipeline import StrictClusterPipeline, StrictClusterTransaction
+from rediscluster.lru import LRUCache
+from rediscluster.partitioners import ModuloPartitioner, SlotPartitioner
+from rediscluster.pools import PoolRegistry, shared_registry
+from rediscluster.replicas import LatencyTracker, ReplicaSet
+from rediscluster.scripts import ClusterScript
+from rediscluster.workers import WorkerPool
 
-class StrictRedisCluster:
-    """
-    Implementation of the Redis Cluster Client using redis.StrictRedis
 
-    This abstract class provides a Python interface to all Redis commands on the cluster of redis servers.
-    and implementing how the commands are sent to and received from the cluster.
+# marker of the replies missing from the client cache
+_missing = object()
+
+# time to live in milliseconds of the temporary keys of _store, refreshed while they are written
+_STORE_TTL = 600000
+
+
+def _replicas(redisent):
+    "Return the list of the redis clients behind the reads client ``redisent``"
+    if isinstance(redisent, ReplicaSet):
+        return redisent.redises
+    return [redisent]
+
+
+def _node_names(cluster):
+    "Return the tuple of the names of the nodes of the ``cluster`` configuration keys are mapped to"
+    no_servers = len(cluster['master_of']) if 'master_of' in cluster else len(cluster['nodes'])
+    return tuple('node_' + str(i) for i in range(1, no_servers + 1))
 
+
+def _address(redisent):
+    "Return the host:port, or the unix socket path, of the server of the redis client ``redisent``"
+    kwargs = redisent.connection_pool.connection_kwargs
+    if 'path' in kwargs:
+        return kwargs['path']
+    return '%s:%s' % (kwargs['host'], kwargs['port'])
+
+
+def _chunks(items, size):
+    "Yield successive lists of at most ``size`` items of the ``items`` list"
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class ClusterRouting(object):
+    """
+    Routing of the redis commands to the servers of a cluster, shared by the
+    topologies and the blocking and asyncio clients
     """
 
     _read_keys = {
@@ -29,6 +74,7 @@ class StrictRedisCluster:
         'zrevrank': 'zrevrank', 'zscore': 'zscore',
         'mget': 'mget', 'bitcount': 'bitcount', 'echo': 'echo', 'debug_object': 'debug_object',
         'substr': 'substr', 'keys': 'keys', 'randomkey': 'randomkey',
+        'sscan': 'sscan', 'hscan': 'hscan', 'zscan': 'zscan',
     }
 
     _write_keys = {
@@ -50,6 +96,7 @@ class StrictRedisCluster:
         'zrem': 'zrem', 'zremrangebyrank': 'zremrangebyrank', 'zremrangebyscore': 'zremrangebyscore', 'zunionstore': 'zunionstore',
         'mset': 'mset', 'msetnx': 'msetnx', 'rename': 'rename', 'renamenx': 'renamenx',
         'del': 'del', 'delete': 'delete', 'ttl': 'ttl', 'pttl': 'pttl', 'flushall': 'flushall', 'flushdb': 'flushdb',
+        'unlink': 'unlink',
     }
 
     _dont_hash = {
@@ -69,6 +116,17 @@ class StrictRedisCluster:
         'zunionstore': 'zunionstore', 'sort': 'sort'
     }
 
+    # commands of _write_keys that do not modify their keys
+    _readonly_keys = {
+        'exists': 'exists', 'hexists': 'hexists', 'ttl': 'ttl', 'pttl': 'pttl',
+        'sdiff': 'sdiff', 'sinter': 'sinter', 'sunion': 'sunion',
+    }
+
+    # commands taking any number of keys, each of them sent to its own node, and their redis command
+    _multi_keys = {
+        'delete': 'DEL', 'unlink': 'UNLINK',
+    }
+
     _loop_keys = {
         'keys': 'keys', 'dbsize': 'dbsize',
 
@@ -79,7 +137,8 @@ class StrictRedisCluster:
         'flushall': 'flushall', 'flushdb': 'flushdb',
         'sync': 'sync',
         'config_set': 'config_set', 'config_get': 'config_get',
-        'time': 'time', 'client_list': 'client_list'
+        'time': 'time', 'client_list': 'client_list',
+        'script_load': 'script_load', 'script_exists': 'script_exists', 'script_flush': 'script_flush',
     }
 
     _loop_keys_admin = {
@@ -93,190 +152,1066 @@ class StrictRedisCluster:
         'time': 'time', 'client_list': 'client_list'
     }
 
-    def __init__(self, cluster={}, db=0, mastersonly=False):
+    def _parse_hash_tag(self, args):
+        """
+        Return the hash key, the position of the hash tag in the key name
+        (None if there is none) and ``args`` with the hash tag removed from
+        the key name, e.g. ("zap", 3, ("bar", ...)) for ("bar{zap}", ...)
+        """
+        # fast path for the most common case, a single key without hash tag
+        if isinstance(args[0], (basestring, bytes)):
+            try:
+                args[0].index('{')
+            except Exception:
+                return args[0], None, args
+
+        tag_start = None
+        key_type = hash_tag = ''
+        # since we don't have "first item" in dict,
+        # this list is needed in order to check hash_tag in mset({"a{a}": "a", "b":"b"})
+        list_ht = []
+        if isinstance(args[0], (basestring, bytes)):
+            key_type = 'string'
+            list_ht.append(args[0])
+        else:
+            if isinstance(args[0], list):
+                key_type = 'list'
+                list_ht.append(args[0][0])
+            else:
+                key_type = 'dict'
+                list_ht = iterkeys(args[0])
+
+        # check for hash tags
+        for k in list_ht:
+            try:
+                tag_start = k.index('{')
+                hash_tag = k
+                break
+            except Exception as e:
+                tag_start = None
+
+        # get the hash key
+        hkey = args[0]
+        # take care of hash tags names for forcing multiple keys on the same node,
+        # e.g. r.set("bar{zap}", "bar"), r.mget(["foo{foo}","bar"])
+        if tag_start is not None:
+            L = list(args)
+            if key_type != 'string':
+                if key_type == 'list':
+                    L[0] = list(L[0])
+                    hkey = L[0][0][tag_start + 1:-1]
+                    L[0][0] = L[0][0][0:tag_start]
+                else:
+                    L[0] = dict(L[0])
+                    hkey = hash_tag[tag_start + 1:-1]
+                    L[0][hash_tag[0:tag_start]] = L[0][hash_tag]
+                    del L[0][hash_tag]
+            else:
+                hkey = L[0][tag_start + 1:-1]
+                L[0] = L[0][0:tag_start]
+
+            args = tuple(L)
+
+        return hkey, tag_start, args
+
+    def _getaliasfor(self, name, hkey):
+        """
+        Return the alias of the redis server the command ``name`` on the hash
+        key ``hkey`` has to be sent to: the master for writes, its slave for reads
+        """
+        node = self._getnodenamefor(hkey)
+        if name in self._write_keys:
+            return node
+        elif name in self._read_keys:
+            return self._slave_aliases[node]
+        raise redis.DataError("rediscluster: Command %s Not Supported (each key name has its own node)" % name)
+
+    def _getkeyfor(self, name, key):
+        """
+        Return the alias of the redis server the command ``name`` on ``key``
+        has to be sent to and the key name with its hash tag removed
+        """
+        hkey, tag_start, (key,) = self._parse_hash_tag((key,))
+        return self._getaliasfor(name, hkey), key
+
+    def _getaliasesfor(self, name, keys):
+        """
+        Group ``keys`` by the alias of the redis server the command ``name``
+        would be sent to. Return a dict of alias: (positions in ``keys``,
+        key names with their hash tag removed)
+        """
+        aliases = {}
+        for i, key in enumerate(keys):
+            hkey, tag_start, (key,) = self._parse_hash_tag((key,))
+            alias = self._getaliasfor(name, hkey)
+            if alias not in aliases:
+                aliases[alias] = ([], [])
+            aliases[alias][0].append(i)
+            aliases[alias][1].append(key)
+        return aliases
+
+    def _getnodenamefor(self, name):
+        "Return the node name where the ``name`` would land to"
+        if self._route_cache is None:
+            return self.partitioner.get_node(name)
+
+        node = self._route_cache.get(name)
+        if node is None:
+            node = self.partitioner.get_node(name)
+            self._route_cache.set(name, node)
+        return node
+
+    def getnodefor(self, name):
+        "Return the node where the ``name`` would land to"
+        node = self._getnodenamefor(name)
+        return {node: self.cluster['nodes'][node]}
+
+    def _split_mapping(self, command, mapping):
+        """
+        Group the items of ``mapping`` by the alias of the redis server the
+        command ``command`` would be sent to. Return a dict of alias: mapping
+        of the key names with their hash tag removed
+        """
+        keys = list(iterkeys(mapping))
+        aliases = self._getaliasesfor(command, keys)
+        return dict((alias, dict((name, mapping[keys[i]]) for i, name in zip(positions, names)))
+                    for alias, (positions, names) in iteritems(aliases))
+
+    def _merge(self, aliases, replies, size):
+        """
+        Return the list of the ``size`` replies of the keys grouped in
+        ``aliases`` by ``_getaliasesfor``, from the dict of alias: replies
+        """
+        result = [None] * size
+        for alias, (positions, names) in iteritems(aliases):
+            for i, reply in zip(positions, replies[alias]):
+                result[i] = reply
+        return result
+
+    def _admin_calls(self, name, *args, **kwargs):
+        """
+        Return the calls of the admin command ``name`` to all the redis
+        servers, as a dict of server id: (function, args), the dict of alias:
+        server ids they are sent to and the dict of alias: None of the
+        servers it doesn't apply to
+        """
+        skipped = {}
+        calls = {}
+        servers = {}
+        for alias, redisent in iteritems(self.redises):
+            if (name in self._write_keys and alias.find('_slave') >= 0) or (name in self._read_keys and alias.find('_slave') == -1):
+                skipped[alias] = None
+                continue
+
+            # masters without slaves are also their own slaves, only query them once
+            servers[alias] = [id(server) for server in _replicas(redisent)]
+            for server in _replicas(redisent):
+                if id(server) not in calls:
+                    calls[id(server)] = (functools.partial(getattr(server, name), *args, **kwargs), ())
+        return calls, servers, skipped
+
+    def _admin_result(self, servers, skipped, replies):
+        """
+        Return the dict of alias: result of an admin command from the dict
+        of server id: reply, raising the first error if all the servers failed
+        """
+        errors = [res for res in itervalues(replies) if isinstance(res, Exception)]
+        if errors and len(errors) == len(replies):
+            raise errors[0]
+
+        result = dict(skipped)
+        for alias, keys in iteritems(servers):
+            if isinstance(self.redises[alias], ReplicaSet):
+                result[alias] = [replies[k] for k in keys]
+            else:
+                result[alias] = replies[keys[0]]
+        return result
+
+    def _scan_cursors(self, cursor):
+        """
+        Return the list of (slave alias, replica index or None, cursor) of
+        the nodes left to scan from the cluster ``cursor``
+        """
+        cursors = []
+        if nativestr(str(cursor)) == '0':
+            for alias in sorted(self.redises):
+                if alias.find('_slave') >= 0:
+                    redisent = self.redises[alias]
+                    replica = redisent.choose() if isinstance(redisent, ReplicaSet) else None
+                    cursors.append((alias, replica, 0))
+            return cursors
+
+        for node_cursor in nativestr(cursor).split(','):
+            alias, node_cursor = node_cursor.rsplit(':', 1)
+            replica = None
+            if alias not in self.redises:
+                alias, replica = alias.rsplit(':', 1)
+                replica = int(replica)
+            cursors.append((alias, replica, int(node_cursor)))
+        return cursors
+
+    def _scan_calls(self, cursors, match=None, count=None, type=None):
+        "Return the SCAN calls of the ``cursors`` as a dict of alias: (function, args)"
+        pieces = []
+        if match is not None:
+            pieces.extend(['MATCH', match])
+        if count is not None:
+            pieces.extend(['COUNT', count])
+        if type is not None:
+            pieces.extend(['TYPE', type])
+
+        calls = {}
+        for alias, replica, node_cursor in cursors:
+            redisent = self.redises[alias]
+            if replica is not None:
+                redisent = redisent.redises[replica]
+            calls[alias] = (redisent.execute_command, ['SCAN', node_cursor] + pieces)
+        return calls
+
+    def _scan_result(self, cursors, replies):
+        """
+        Return the cluster cursor to resume the scan of ``cursors`` from and
+        the keys of the dict of alias: SCAN reply
+        """
+        keys = []
+        next_cursors = []
+        for alias, replica, node_cursor in cursors:
+            if alias in replies:
+                node_cursor, data = replies[alias]
+                node_cursor = int(node_cursor)
+                keys.extend(data)
+                if node_cursor == 0:
+                    continue
+            if replica is None:
+                next_cursors.append('%s:%d' % (alias, node_cursor))
+            else:
+                next_cursors.append('%s:%d:%d' % (alias, replica, node_cursor))
+
+        return ','.join(next_cursors) or '0', keys
+
+
+class Topology(ClusterRouting):
+    """
+    Servers of the cluster configuration ``cluster`` and routing of the keys
+    to them with ``partitioner``
+
+    The clients hold their topology in a single attribute, read once by
+    every command, so that it can be swapped for another one at once while
+    commands are in flight, e.g. by ``reload_topology``. A topology is
+    never changed once in use, but replaced by a modified ``copy``.
+    """
+
+    def __init__(self, cluster, partitioner=ModuloPartitioner, route_cache_size=0):
+        self.cluster = cluster
+        nodes = _node_names(cluster)
+        self.no_servers = len(nodes)
+        # a partitioner class, or an already built partitioner, mapping keys to node names
+        if isinstance(partitioner, type) and issubclass(partitioner, SlotPartitioner) and cluster.get('slots'):
+            # slot table of the configuration, e.g. written by rediscluster-migrate --slots-out
+            partitioner = partitioner(nodes, cluster['slots'])
+        elif isinstance(partitioner, type) or not hasattr(partitioner, 'get_node'):
+            partitioner = partitioner(nodes)
+        self.partitioner = partitioner
+        self._slave_aliases = dict((node, node + '_slave') for node in nodes)
+        # optional cache of the node of the most used hash keys
+        self._route_cache = LRUCache(route_cache_size) if route_cache_size else None
+        # alias: client of the master or slaves of every node
+        self.redises = {}
+        # moving average latency of every server, shared by the replica sets
+        self.latency_tracker = None
+        # node: number of health checks its master failed in a row
+        self._failures = {}
+        # node: SHA1 of the lua scripts loaded on its master
+        self._script_shas = {}
+        # topology read from during a migration
+        self._previous = None
+        # (node, key name) written during a migration, no longer read from the previous topology
+        self._written = set()
+
+    def copy(self, **attributes):
+        "Return a copy of the topology with the ``attributes`` changed"
+        topology = copy.copy(self)
+        topology.__dict__.update(attributes)
+        return topology
+
+    def _track(self, indexes):
+        """
+        Record the (node, key name) ``indexes`` as written during the
+        migration, their previous node not being read from anymore
+        """
+        if self._previous is not None:
+            self._written.update(indexes)
+
+    def _moved_from(self, hkey, key=None):
+        """
+        Return the previous topology if the hash key ``hkey`` landed to
+        another server in it and the key name ``key``, if given, was not
+        written since, None otherwise
+        """
+        previous = self._previous
+        if previous is None:
+            return None
+        node = self._getnodenamefor(hkey)
+        if key is not None and (node, encode_key(key)) in self._written:
+            return None
+        old = previous.cluster['nodes'][previous._getnodenamefor(hkey)]
+        new = self.cluster['nodes'][node]
+        if (old['host'], int(old['port'])) == (new['host'], int(new['port'])):
+            return None
+        return previous
+
+
+class BaseRedisCluster(ClusterRouting):
+    """
+    Redis cluster client, shared by the blocking and asyncio clients. The
+    servers and the routing of the keys are held by ``topology``.
+    Subclasses build the method sending each command in ``_build_command``
+    and connect to the servers.
+    """
+
+    @property
+    def cluster(self):
+        "The cluster configuration of the current topology"
+        return self.topology.cluster
+
+    @property
+    def no_servers(self):
+        "The number of nodes of the current topology"
+        return self.topology.no_servers
+
+    @property
+    def partitioner(self):
+        "The partitioner mapping keys to the nodes of the current topology"
+        return self.topology.partitioner
+
+    @property
+    def redises(self):
+        "The dict of alias: client of the servers of the current topology"
+        return self.topology.redises
+
+    @property
+    def latency_tracker(self):
+        "The latency tracker of the servers of the current topology"
+        return self.topology.latency_tracker
+
+    @property
+    def _slave_aliases(self):
+        "The dict of node: alias of its slaves in the current topology"
+        return self.topology._slave_aliases
+
+    @property
+    def _route_cache(self):
+        "The cache of the nodes of the hash keys of the current topology"
+        return self.topology._route_cache
+
+    @property
+    def _failures(self):
+        "The dict of node: health checks failed in a row in the current topology"
+        return self.topology._failures
+
+    @property
+    def _script_shas(self):
+        "The dict of node: SHA1 of the scripts loaded in the current topology"
+        return self.topology._script_shas
+
+    @property
+    def _previous(self):
+        "The previous topology read from during a migration, None otherwise"
+        return self.topology._previous
+
+    def _pinned(self):
+        """
+        Return a shallow copy of the client bound to its current topology,
+        for the commands reading it several times, e.g. the ``_rc_*`` ones
+        """
+        return copy.copy(self)
+
+    def _getslavefrominfo(self, info):
+        """
+        Return the host and port of the first online slave listed in the
+        INFO reply ``info`` of a master, an empty dict if there is none
+        """
+        slaves = self._getslavesfrominfo(info)
+        return slaves[0] if slaves else {}
+
+    def _getslavesfrominfo(self, info):
+        """
+        Return the list of the host and port of all the online slaves
+        listed in the INFO reply ``info`` of a master
+        """
+        slaves = []
+        for i in range(info.get('connected_slaves', 0)):
+            slave = info.get('slave%d' % i)
+            if not slave:
+                continue
+            # "ip=...,port=...,state=online,..." is parsed as a dict since redis 2.8
+            if isinstance(slave, dict):
+                slave_host, slave_port, slave_online = slave['ip'], slave['port'], slave['state']
+            else:
+                slave_host, slave_port, slave_online = slave.split(',')[:3]
+            if slave_online == 'online':
+                slaves.append({'host': slave_host, 'port': slave_port})
+        return slaves
+
+    def __getattr__(self, name):
+        """
+        Magic method to handle all redis commands
+        - string name The name of the command called.
+
+        The method sending the command is built on first use and then cached
+        on the class, so later calls don't go through __getattr__ anymore.
+        """
+        if name.startswith('__'):
+            raise AttributeError(name)
+
+        command = self._build_command(name)
+        setattr(self.__class__, name, command)
+        return getattr(self, name)
+
+    def _build_command(self, name):
+        "Return the function sending the command ``name`` to the cluster"
+        raise NotImplementedError()
+
+
+class StrictRedisCluster(BaseRedisCluster):
+    """
+    Implementation of the Redis Cluster Client using redis.StrictRedis
+
+    This abstract class provides a Python interface to all Redis commands on the cluster of redis servers.
+    and implementing how the commands are sent to and received from the cluster.
+
+    """
+
+    # read commands whose replies can be kept in the client cache
+    _cached_keys = {
+        'get': 'get', 'hget': 'hget', 'hgetall': 'hgetall',
+    }
+
+    def __init__(self, cluster={}, db=0, mastersonly=False, max_workers=None, node_timeout=None,
+                 partitioner=ModuloPartitioner, route_cache_size=0, connect_timeout=None, chunk_size=1000,
+                 buffer_size=100000, pool_options=None, shared_pools=False,
+                 health_check_interval=None, failover_attempts=3, promote_slaves=False, read_strategy='round_robin',
+                 read_from_master=False, latency_cooldown=5.0, latency_check_interval=1.0, client_cache=None):
         # raise exception when wrong server hash
         if 'nodes' not in cluster:
             raise Exception(
                 "rediscluster: Please set a correct array of redis cluster.")
 
-        self.cluster = cluster
+        # options to build the clients of the next topologies with
+        self._options = dict(
+            db=db, mastersonly=mastersonly, max_workers=max_workers, node_timeout=node_timeout,
+            partitioner=partitioner, route_cache_size=route_cache_size, connect_timeout=connect_timeout,
+            chunk_size=chunk_size, buffer_size=buffer_size, pool_options=pool_options,
+            failover_attempts=failover_attempts, promote_slaves=promote_slaves, read_strategy=read_strategy,
+            read_from_master=read_from_master, latency_cooldown=latency_cooldown)
+
+        # servers of the cluster and routing of the keys to them, swapped on reload
+        self.topology = topology = Topology(cluster, partitioner, route_cache_size)
+        self.db = db
+        self.chunk_size = chunk_size
+        self.buffer_size = buffer_size
+        self.max_workers = max_workers
+        self.node_timeout = node_timeout
+        # threads sending the commands involving many nodes, kept for the life of the client
+        self._workers = WorkerPool(max_workers)
+        self.pool_options = pool_options or {}
+        self.read_strategy = read_strategy
+        self.read_from_master = read_from_master
+        topology.latency_tracker = LatencyTracker(cooldown=latency_cooldown)
+        if shared_pools is True:
+            shared_pools = shared_registry
+        elif shared_pools is False or shared_pools is None:
+            shared_pools = PoolRegistry()
+        self.pool_registry = shared_pools
+        self._options['shared_pools'] = shared_pools
         have_master_of = 'master_of' in self.cluster
-        self.no_servers = len(self.cluster['master_of']) if have_master_of else len(self.cluster['nodes'])
-
-        self.redises = {}
-        redises_cons = {}
         self.cluster['slaves'] = {}
 
-        # connect to all servers
+        # group the aliases of a same server, to only connect to it once
+        servers = {}
         for alias, server in iteritems(self.cluster['nodes']):
-
             if have_master_of and alias not in self.cluster['master_of']:
                 continue
-
-            server_str = str(server)
-            if server_str in redises_cons:
-                self.redises[alias] = redises_cons[server_str]['master']
-                self.redises[alias +
-                             '_slave'] = redises_cons[server_str]['slave']
-                self.cluster['slaves'][alias +
-                                       '_slave'] = redises_cons[server_str]['slave_node']
+            servers.setdefault(str(server), []).append(alias)
+
+        # connect to all servers and discover their slaves at the same time
+        replies = self._execute_parallel(dict(
+            (server_str, (self._connect, (aliases[0], db, mastersonly)))
+            for server_str, aliases in iteritems(servers)), raise_on_error=False, timeout=connect_timeout)
+
+        errors = [str(res) for res in itervalues(replies) if isinstance(res, Exception)]
+        if errors:
+            raise redis.ConnectionError("; ".join(sorted(errors)))
+
+        for server_str, (master, slave, slave_node) in iteritems(replies):
+            for alias in servers[server_str]:
+                topology.redises[alias] = master
+                topology.redises[alias + '_slave'] = slave
+                self.cluster['slaves'][alias + '_slave'] = slave_node
+
+        # check the masters in the background and fail over the nodes down
+        self.failover_attempts = failover_attempts
+        self.promote_slaves = promote_slaves
+        self._failover_lock = threading.Lock()
+        self._closed = threading.Event()
+        if health_check_interval:
+            thread = threading.Thread(target=self._health_check_loop, args=(health_check_interval,))
+            thread.daemon = True
+            thread.start()
+
+        # measure the latency of the servers with PING for the strategies relying on it
+        if read_strategy in ReplicaSet.LATENCY_STRATEGIES and not mastersonly:
+            self.check_latency()
+            if latency_check_interval:
+                thread = threading.Thread(target=self._latency_check_loop, args=(latency_check_interval,))
+                thread.daemon = True
+                thread.start()
+
+        # cache of the hot keys, invalidated through client tracking on every master
+        self.client_cache = client_cache
+        self._listeners = []
+        self._start_listeners()
+
+    def _start_listeners(self):
+        "Start listening to the invalidation messages of every master for the client cache"
+        if self.client_cache is None:
+            return
+        topology = self.topology
+        # one listener per server, invalidating the replies cached for every node it is the master of
+        masters = {}
+        for node in sorted(topology._slave_aliases):
+            masters.setdefault(id(topology.redises[node]), []).append(node)
+        for nodes in itervalues(masters):
+            listener = InvalidationListener(self.client_cache, nodes, topology.redises[nodes[0]])
+            listener.start()
+            self._listeners.append(listener)
+
+    def _restart_listeners(self):
+        "Listen to the invalidation messages of the masters of the current topology only"
+        for listener in self._listeners:
+            listener.close()
+        self._listeners = []
+        self._start_listeners()
+
+    def _connect(self, alias, db, mastersonly):
+        """
+        Connect to the master ``alias`` and to its slave, return the master
+        and slave clients and the slave configuration
+        """
+        have_master_of = 'master_of' in self.cluster
+        server = self.cluster['nodes'][alias]
+        options = dict(self.pool_options, **server)
+        try:
+            # connect to master
+            master = self._redis(db, options)
+            info = {}
+            if not mastersonly and not have_master_of:
+                info = master.info()
+                if info['role'] != 'master':
+                    raise redis.DataError(
+                        "rediscluster: server %s is not a master." % (server,))
+        except redis.RedisError as e:
+            raise redis.ConnectionError(
+                "rediscluster cannot connect to: %s %s" % (server, e))
+
+        # connect to slaves
+        slaves = []
+        if not mastersonly:
+            if have_master_of:
+                names = self.cluster['master_of'][alias]
+                if isinstance(names, (basestring, bytes)):
+                    names = [names]
+                slaves = [(self.cluster['nodes'][name], dict(self.pool_options, **self.cluster['nodes'][name]))
+                          for name in names]
             else:
-                try:
-                    # connect to master
-                    self.__redis = redis.StrictRedis(db=db, **server)
-                    if not mastersonly and not have_master_of:
-                        info = self.__redis.info()
-                        if info['role'] != 'master':
-                            raise redis.DataError(
-                                "rediscluster: server %s is not a master." % (server,))
-
-                    self.redises[alias] = self.__redis
-                    redises_cons[server_str] = {}
-                    redises_cons[server_str]['master'] = self.redises[alias]
-
-                    # connect to slave
-                    slave_connected = False
-                    slave = {}
-                    if not mastersonly:
-                        if have_master_of:
-                            slave = self.cluster[
-                                'nodes'][self.cluster['master_of'][alias]]
-                        elif 'connected_slaves' in info and info['connected_slaves'] > 0:
-                            slave_host, slave_port, slave_online = info[
-                                'slave0'].split(',')
-                            if slave_online == 'online':
-                                slave = {'host': slave_host, 'port': slave_port}
-
-                    if slave :
-                        try:
-                            redis_slave = redis.StrictRedis(host=slave['host'], port=int(slave['port']), db=db)
-                            self.redises[alias + '_slave'] = redis_slave
-                            self.cluster['slaves'][alias + '_slave'] = {
-                                'host': slave['host'], 'port': slave['port']}
-                            redises_cons[server_str][
-                                'slave'] = self.redises[alias + '_slave']
-                            redises_cons[server_str]['slave_node'] = self.cluster['slaves'][alias + '_slave']
-                            slave_connected = True
-                        except redis.RedisError as e:
-                            pass
-                            # "RedisCluster cannot connect to: " + slave_host +':'+ slave_port
-
-                    if not slave_connected:
-                        self.redises[alias + '_slave'] = self.redises[alias]
-                        self.cluster['slaves'][alias + '_slave'] = server
-                        redises_cons[server_str][
-                            'slave'] = self.redises[alias + '_slave']
-                        redises_cons[server_str]['slave_node'] = self.cluster[
-                            'slaves'][alias + '_slave']
-
-                except redis.RedisError as e:
-                    raise redis.ConnectionError(
-                        "rediscluster cannot connect to: %s %s" % (server, e))
-
-    def __getattr__(self, name, *args, **kwargs):
+                # the slaves are set up as their master, e.g. timeouts and password
+                slaves = [(slave, dict(options, host=slave['host'], port=slave['port'], unix_socket_path=None))
+                          for slave in self._getslavesfrominfo(info)]
+
+        if not slaves:
+            return master, master, server
+        readers = self._readers(master, [self._redis(db, slave_options) for slave, slave_options in slaves])
+        return master, readers, {'host': slaves[0][0]['host'], 'port': slaves[0][0]['port']}
+
+    def _readers(self, master, replicas):
         """
-        Magic method to handle all redis commands
-        - string name The name of the command called.
-        - tuple args of supplied arguments to the command.
+        Return the client the reads of a node are sent to: its replica, or
+        a ReplicaSet balancing them over the ``replicas`` (and ``master``
+        with ``read_from_master``) according to ``read_strategy``
         """
-        def function(*args, **kwargs):
-            if name not in StrictRedisCluster._loop_keys:
-                # take care of hash tags
-                tag_start = None
-                key_type = hash_tag = ''
-                # since we don't have "first item" in dict,
-                # this list is needed in order to check hash_tag in mset({"a{a}": "a", "b":"b"})
-                list_ht = []
-                if isinstance(args[0], (basestring, bytes)):
-                    key_type = 'string'
-                    list_ht.append(args[0])
-                else:
-                    if isinstance(args[0], list):
-                        key_type = 'list'
-                        list_ht.append(args[0][0])
-                    else:
-                        key_type = 'dict'
-                        list_ht = iterkeys(args[0])
-
-                # check for hash tags
-                for k in list_ht:
-                    try:
-                        tag_start = k.index('{')
-                        hash_tag = k
-                        break
-                    except Exception as e:
-                        tag_start = None
-
-                # trigger error msg on tag keys unless we have hash tags e.g. "bar{zap}"
-                if name in StrictRedisCluster._tag_keys and not tag_start:
-                    try:
-                        return getattr(self, '_rc_' + name)(*args, **kwargs)
-                    except AttributeError:
-                        raise redis.DataError("rediscluster: Command %s Not Supported (each key name has its own node)" % name)
-
-                # get the hash key
-                hkey = args[0]
-                # take care of hash tags names for forcing multiple keys on the same node,
-                # e.g. r.set("bar{zap}", "bar"), r.mget(["foo{foo}","bar"])
-                if tag_start is not None:
-                    L = list(args)
-                    if key_type != 'string':
-                        if key_type == 'list':
-                            hkey = L[0][0][tag_start + 1:-1]
-                            L[0][0] = L[0][0][0:tag_start]
-                        else:
-                            hkey = hash_tag[tag_start + 1:-1]
-                            L[0][hash_tag[0:tag_start]] = L[0][hash_tag]
-                            del L[0][hash_tag]
-                    else:
-                        hkey = L[0][tag_start + 1:-1]
-                        L[0] = L[0][0:tag_start]
-
-                    args = tuple(L)
-
-                # get the node number
-                node = self._getnodenamefor(hkey)
-                if name in StrictRedisCluster._write_keys:
-                    redisent = self.redises[node]
-                elif name in StrictRedisCluster._read_keys:
-                    redisent = self.redises[node + '_slave']
-                else:
-                    raise redis.DataError("rediscluster: Command %s Not Supported (each key name has its own node)" % name)
+        readers = list(replicas)
+        if self.read_from_master or not readers:
+            readers.append(master)
+        if len(readers) == 1:
+            return readers[0]
+        return ReplicaSet(readers, self.read_strategy, self.latency_tracker)
+
+    def _redis(self, db, options):
+        """
+        Return a redis client of the server described by the ``options``
+        dict of connection and pool options, using the pool of the registry.
+        The ``socket_timeout`` of the connections is ``node_timeout`` unless
+        given in the options, so that the calls to a hung server return
+        """
+        if self.node_timeout and options.get('socket_timeout') is None:
+            options = dict(options, socket_timeout=self.node_timeout)
+        return redis.StrictRedis(connection_pool=self.pool_registry.get_pool(db=db, **options))
 
-                # Execute the command on the server
-                return getattr(redisent, name)(*args, **kwargs)
+    def close(self):
+        """
+        Stop the background health checking, cache invalidation and topology
+        watching, and the threads sending the commands involving many nodes
+        """
+        self._closed.set()
+        for listener in self._listeners:
+            listener.close()
+        self._workers.close()
 
-            else:
+    def reload_topology(self, cluster, partitioner=None, dual_read=True, background=False):
+        """
+        Switch to the cluster configuration ``cluster``.
+
+        The connections to the new servers are set up and the routing table
+        built before the topology of the client is replaced by the new one,
+        at once for the commands in flight. With ``dual_read``, the reads of keys missing from their new node
+        are then sent to their previous node, until ``finish_migration`` is
+        called. ``partitioner`` defaults to the partitioner class in use,
+        a SlotPartitioner keeping its slot table and moving the slots of the
+        nodes added or removed only, unless ``cluster`` has its own ``slots``.
+        With ``background``, return at once the thread doing the reload.
+        """
+        if background:
+            thread = threading.Thread(target=self.reload_topology, args=(cluster, partitioner, dual_read))
+            thread.daemon = True
+            thread.start()
+            return thread
+
+        # the new client adds the slaves it discovers to its configuration
+        cluster = copy.deepcopy(cluster)
+        options = dict(self._options)
+        if partitioner is not None:
+            options['partitioner'] = partitioner
+        elif not cluster.get('slots') and hasattr(self.partitioner, 'resized'):
+            # keep the slot table, only moving the slots of the nodes added or removed
+            options['partitioner'] = self.partitioner.resized(_node_names(cluster))
+        elif not isinstance(options['partitioner'], type):
+            options['partitioner'] = type(options['partitioner'])
+        # the latency of the new servers is measured by the thread of this client
+        new = self.__class__(cluster=cluster, latency_check_interval=None, **options)
+
+        with self._failover_lock:
+            previous = self.topology.copy(_previous=None) if dual_read else None
+            self.topology = new.topology.copy(_previous=previous)
+        # only the topology of the new client is kept
+        new._workers.close()
+        self._restart_listeners()
+
+    def finish_migration(self):
+        "Stop reading the keys missing from their node on their previous node"
+        with self._failover_lock:
+            self.topology = self.topology.copy(_previous=None, _written=set())
+
+    def watch_topology(self, source, interval=5.0, dual_read=True):
+        """
+        Reload the topology whenever the cluster configuration read from
+        ``source``, the path of a JSON file or a callable, changes. It is
+        checked every ``interval`` seconds by a background thread, returned
+        """
+        def load():
+            if callable(source):
+                return source()
+            with open(source) as f:
+                return json.load(f)
+
+        def snapshot(cluster):
+            # the slaves discovered by the client are not part of the configuration
+            return json.dumps(dict((k, v) for k, v in iteritems(cluster) if k != 'slaves'), sort_keys=True)
+
+        def watch():
+            last = snapshot(self.cluster)
+            while True:
+                try:
+                    cluster = load()
+                    current = snapshot(cluster)
+                    if current != last:
+                        self.reload_topology(cluster, dual_read=dual_read)
+                        last = current
+                except Exception:
+                    pass
+                if self._closed.wait(interval):
+                    return
+
+        thread = threading.Thread(target=watch)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def _health_check_loop(self, interval):
+        while not self._closed.wait(interval):
+            try:
+                self.check_health()
+            except Exception:
+                pass
+
+    def _latency_check_loop(self, interval):
+        while not self._closed.wait(interval):
+            try:
+                self.check_latency()
+            except Exception:
+                pass
+
+    def _invalidate(self, keys):
+        "Drop the cached replies of the key names ``keys`` from the client cache"
+        self.client_cache.invalidate([
+            (alias, encode_key(name)) for alias, name in (self._getkeyfor('set', key) for key in keys)])
+
+    def _track(self, name, keys):
+        """
+        Record the key names ``keys`` written by the command ``name`` during
+        a migration, so that they are not read from their previous node anymore
+        """
+        topology = self.topology
+        if topology._previous is not None and name not in self._readonly_keys:
+            topology._track([
+                (alias, encode_key(key)) for alias, key in (topology._getkeyfor('set', key) for key in keys)])
 
-                # take care of keys that don't need to go through master and slaves redis servers
-                if name not in self._loop_keys_admin:
-                    try:
-                        return getattr(self, '_rc_' + name)(*args, **kwargs)
-                    except AttributeError:
-                        raise redis.DataError("rediscluster: Command %s Not Supported (each key name has its own node)" % name)
+    def _evict(self, node, names):
+        "Drop the cached replies of the key names ``names``, hash tags removed, of the node ``node``"
+        if self.client_cache is not None:
+            self.client_cache.invalidate([(node, encode_key(name)) for name in names])
 
-                result = {}
-                for alias, redisent in iteritems(self.redises):
-                    if (name in StrictRedisCluster._write_keys and alias.find('_slave') >= 0) or (name in StrictRedisCluster._read_keys and alias.find('_slave') == -1):
-                        res = None
-                    else:
-                        res = getattr(redisent, name)(*args, **kwargs)
+    def check_latency(self):
+        """
+        Measure the latency of every master and slave with PING, at the same
+        time, and return a dict of server: moving average latency in seconds
+        """
+        topology = self.topology
+        servers = {}
+        for redisent in itervalues(topology.redises):
+            for server in _replicas(redisent):
+                servers.setdefault(_address(server), server)
+
+        tracker = topology.latency_tracker
+
+        def ping(server):
+            start = time.time()
+            try:
+                server.ping()
+            except (redis.ConnectionError, redis.TimeoutError):
+                tracker.fail(server)
+                raise
+            tracker.record(server, time.time() - start)
+            return tracker.get(server)
+
+        return self._execute_parallel(dict(
+            (name, (ping, (server,))) for name, server in iteritems(servers)), raise_on_error=False)
+
+    def check_health(self):
+        """
+        Check the role of the master of every node with INFO and fail over
+        the nodes whose master has been demoted to a slave, or has not
+        replied to ``failover_attempts`` checks in a row. Return the list of
+        the node names that failed over.
+
+        A demoted master is replaced by the master it now replicates, a
+        master down by the slave of the node once it is a master, e.g.
+        promoted by sentinel, or promoted with SLAVEOF NO ONE by the client
+        itself with ``promote_slaves``. The topology of the client is
+        replaced at once by one with the new connections.
+        """
+        with self._failover_lock:
+            topology = self.topology
+            failures = topology._failures
+            masters = {}
+            for node in sorted(topology._slave_aliases):
+                masters.setdefault(id(topology.redises[node]), []).append(node)
+            replies = self._execute_parallel(dict(
+                (nodes[0], (topology.redises[nodes[0]].info, ('replication',))) for nodes in itervalues(masters)),
+                raise_on_error=False)
+
+            redises = dict(topology.redises)
+            cluster = dict(topology.cluster, nodes=dict(topology.cluster['nodes']),
+                           slaves=dict(topology.cluster['slaves']))
+            failed_over = []
+            for node, info in iteritems(replies):
+                master = None
+                if isinstance(info, Exception):
+                    failures[node] = failures.get(node, 0) + 1
+                    if failures[node] >= self.failover_attempts:
+                        master = self._promote(topology, node)
+                else:
+                    failures.pop(node, None)
+                    if nativestr(info.get('role')) == 'slave':
+                        server = dict(cluster['nodes'][node], host=info['master_host'], port=info['master_port'])
+                        master = self._redis(self.db, dict(self.pool_options, **server))
+                if master is None:
+                    continue
+
+                failures.pop(node, None)
+                old = topology.redises[node]
+                replicas = [r for r in _replicas(topology.redises[node + '_slave']) if r is not old and r is not master]
+                readers = self._readers(master, replicas)
+                kwargs = master.connection_pool.connection_kwargs
+                slave_kwargs = (replicas[0] if replicas else master).connection_pool.connection_kwargs
+                for alias in masters[id(old)]:
+                    redises[alias] = master
+                    redises[alias + '_slave'] = readers
+                    cluster['nodes'][alias] = dict(cluster['nodes'][alias], host=kwargs['host'], port=kwargs['port'])
+                    cluster['slaves'][alias + '_slave'] = {
+                        'host': slave_kwargs['host'], 'port': slave_kwargs['port']}
+                    failed_over.append(alias)
+
+            if failed_over:
+                self.topology = topology.copy(redises=redises, cluster=cluster)
+                self._restart_listeners()
+            return sorted(failed_over)
+
+    def _promote(self, topology, node):
+        """
+        Return the first slave of the node ``node`` of ``topology`` that is a
+        master, or that could be promoted to master with ``promote_slaves``,
+        None otherwise
+        """
+        for slave in _replicas(topology.redises[node + '_slave']):
+            if slave is topology.redises[node]:
+                continue
+            try:
+                if nativestr(slave.info('replication').get('role')) != 'master':
+                    if not self.promote_slaves:
+                        continue
+                    slave.slaveof()
+            except redis.RedisError:
+                continue
+            return slave
+        return None
 
-                    result[alias] = res
+    def _build_command(self, name):
+        """
+        Return the function sending the command ``name`` to the cluster,
+        resolving once how the command has to be routed
+        """
+        cls = self.__class__
+        rc_command = getattr(cls, '_rc_' + name, None)
 
-                return result
+        def not_supported(self, *args, **kwargs):
+            raise redis.DataError("rediscluster: Command %s Not Supported (each key name has its own node)" % name)
 
-        return function
+        if name in cls._loop_keys:
+            # take care of keys that don't need to go through master and slaves redis servers
+            if name in cls._loop_keys_admin:
+                def command(self, *args, **kwargs):
+                    if name in ('flushdb', 'flushall') and self.client_cache is not None:
+                        try:
+                            return self._execute_admin(name, *args, **kwargs)
+                        finally:
+                            self.client_cache.clear()
+                    return self._execute_admin(name, *args, **kwargs)
+            elif rc_command is not None:
+                def command(self, *args, **kwargs):
+                    return rc_command(self._pinned(), *args, **kwargs)
+            else:
+                command = not_supported
+            return command
+
+        is_write = name in cls._write_keys
+        is_read = name in cls._read_keys
+        is_tag = name in cls._tag_keys
+        # writes hiding the value of their keys on their previous node during a migration
+        is_tracked = is_write and name not in cls._readonly_keys
+
+        if name in cls._multi_keys and rc_command is not None:
+            def command(self, *args, **kwargs):
+                pinned = self._pinned()
+                pinned._track(name, written_keys(name, args))
+                if self.client_cache is not None:
+                    try:
+                        return rc_command(pinned, *args, **kwargs)
+                    finally:
+                        pinned._invalidate(written_keys(name, args))
+                return rc_command(pinned, *args, **kwargs)
+            return command
+
+        def command(self, *args, **kwargs):
+            # take care of hash tags
+            hkey, tag_start, tagged_args = self._parse_hash_tag(args)
+
+            # trigger error msg on tag keys unless we have hash tags e.g. "bar{zap}"
+            if is_tag and not tag_start:
+                if rc_command is None:
+                    return not_supported(self)
+                pinned = self._pinned()
+                if is_write:
+                    pinned._track(name, written_keys(name, args))
+                if is_write and self.client_cache is not None:
+                    try:
+                        return rc_command(pinned, *args, **kwargs)
+                    finally:
+                        pinned._invalidate(written_keys(name, args))
+                return rc_command(pinned, *args, **kwargs)
+
+            topology = self.topology
+            if is_write:
+                node = topology._getnodenamefor(hkey)
+                redisent = topology.redises[node]
+                if is_tracked and topology._previous is not None:
+                    topology._track([(node, encode_key(key)) for key in written_keys(name, tagged_args)])
+                if self.client_cache is not None:
+                    # evict the cached replies of the keys written, for read-your-writes
+                    try:
+                        return getattr(redisent, name)(*tagged_args, **kwargs)
+                    finally:
+                        self.client_cache.invalidate(
+                            [(node, encode_key(key)) for key in written_keys(name, tagged_args)])
+            elif is_read:
+                redisent = topology.redises[topology._slave_aliases[topology._getnodenamefor(hkey)]]
+                if topology._previous is not None:
+                    # during a migration, read the key from its previous node if missing
+                    response = getattr(redisent, name)(*tagged_args, **kwargs)
+                    previous = topology._moved_from(hkey, tagged_args[0]) if not response else None
+                    if previous is not None:
+                        redisent = previous.redises[previous._slave_aliases[previous._getnodenamefor(hkey)]]
+                        return getattr(redisent, name)(*tagged_args, **kwargs)
+                    return response
+            else:
+                return not_supported(self)
+
+            # Execute the command on the server
+            return getattr(redisent, name)(*tagged_args, **kwargs)
+
+        if name in cls._cached_keys:
+            uncached = command
+
+            def command(self, *args, **kwargs):
+                cache = self.client_cache
+                if cache is None or kwargs:
+                    return uncached(self, *args, **kwargs)
+                key = (name,) + args
+                value = cache.get(key, _missing)
+                if value is _missing:
+                    hkey, tag_start, tagged_args = self._parse_hash_tag(args)
+                    if not cache.cacheable(tagged_args[0]):
+                        return uncached(self, *args)
+                    generation = cache.generation
+                    topology = self.topology
+                    node = topology._getnodenamefor(hkey)
+                    # read from the master, the slaves may not have the last writes yet
+                    value = getattr(topology.redises[node], name)(*tagged_args)
+                    previous = topology._moved_from(hkey, tagged_args[0]) if not value else None
+                    if previous is not None:
+                        value = getattr(previous.redises[previous._getnodenamefor(hkey)], name)(*tagged_args)
+                    cache.set(key, value, (node, encode_key(tagged_args[0])), generation)
+                if isinstance(value, dict):
+                    return dict(value)
+                return value
+
+        return command
+
+    def _execute_admin(self, name, *args, **kwargs):
+        """
+        Execute the admin command ``name`` on all the redis servers at the same
+        time and return a dict of alias: result, the list of the results of
+        its replicas for a slave alias reading from several of them. A server
+        that fails gets its exception as result, unless all of them fail.
+        """
+        topology = self.topology
+        calls, servers, skipped = topology._admin_calls(name, *args, **kwargs)
+        return topology._admin_result(servers, skipped, self._execute_parallel(calls, raise_on_error=False))
 
-    def _getnodenamefor(self, name):
-        "Return the node name where the ``name`` would land to"
-        return 'node_' + str(
-            (abs(binascii.crc32(b(name)) & 0xffffffff) % self.no_servers) + 1)
+    def _execute_parallel(self, calls, raise_on_error=True, timeout=None):
+        """
+        Execute the ``calls`` dict of key: (function, args) at the same time,
+        on the pool of at most ``max_workers`` threads of the client, and
+        return a dict of key: result.
+        A call that hasn't returned after ``timeout`` seconds (``node_timeout``
+        by default) fails with a ConnectionError. The first error is raised once all the calls are
+        done, unless ``raise_on_error`` is False, in which case the exception
+        is returned as the result of the call that failed.
+        """
+        results = {}
+        errors = []
+        timeout = timeout or self.node_timeout
+        if len(calls) < 2 and not timeout:
+            for k, (func, args) in iteritems(calls):
+                try:
+                    results[k] = func(*args)
+                except Exception as e:
+                    if raise_on_error:
+                        raise
+                    results[k] = e
+            return results
+
+        done = Queue()
+        abandoned = threading.Event()
+
+        def run(k, func, args):
+            # don't start the calls still waiting for a thread after the timeout
+            if abandoned.is_set():
+                return
+            try:
+                done.put((k, func(*args), False))
+            except Exception as e:
+                done.put((k, e, True))
+
+        for k, (func, args) in iteritems(calls):
+            self._workers.submit(run, k, func, args)
+
+        deadline = time.time() + timeout if timeout else None
+        for i in range(len(calls)):
+            try:
+                if deadline is None:
+                    k, res, failed = done.get()
+                else:
+                    k, res, failed = done.get(timeout=max(deadline - time.time(), 0))
+            except Empty:
+                break
+            results[k] = res
+            if failed:
+                errors.append(res)
+
+        if len(results) < len(calls):
+            abandoned.set()
+            for k in calls:
+                if k not in results:
+                    results[k] = redis.ConnectionError(
+                        "rediscluster: %s did not reply within %s seconds" % (k, timeout))
+                    errors.append(results[k])
+
+        if errors and raise_on_error:
+            raise errors[0]
+        return results
+
+    def _execute_colocated(self, name, keys):
+        """
+        Send the command ``name`` on ``keys`` to the redis server they all
+        land to. Return None if they are spread over several nodes
+        """
+        topology = self.topology
+        aliases = topology._getaliasesfor(name, keys)
+        if len(aliases) != 1:
+            return None
+        for alias, (positions, names) in iteritems(aliases):
+            return getattr(topology.redises[alias], name)(*names)
+
+    def _execute_pipelined(self, name, calls):
+        """
+        Send the command ``name`` once per tuple of arguments in ``calls``,
+        the key name first, with one pipeline per redis server executed in
+        parallel. Return the replies in the order of ``calls``
+        """
+        topology = self.topology
+        aliases = topology._getaliasesfor(name, [args[0] for args in calls])
 
-    def getnodefor(self, name):
-        "Return the node where the ``name`` would land to"
-        node = self._getnodenamefor(name)
-        return {node: self.cluster['nodes'][node]}
+        def execute(redisent, positions, names):
+            pipe = redisent.pipeline(transaction=False)
+            command = getattr(pipe, name)
+            for i, key in zip(positions, names):
+                command(key, *calls[i][1:])
+            return pipe.execute()
+
+        replies = self._execute_parallel(dict(
+            (alias, (execute, (topology.redises[alias], positions, names)))
+            for alias, (positions, names) in iteritems(aliases)))
+        return topology._merge(aliases, replies, len(calls))
 
     def __setitem__(self, name, value):
         "Set the value at key ``name`` to ``value``"
@@ -298,9 +1233,164 @@ class StrictRedisCluster:
 
     def object(self, infotype, key):
         "Return the encoding, idletime, or refcount about the key"
-        redisent = self.redises[self._getnodenamefor(key) + '_slave']
+        topology = self.topology
+        redisent = topology.redises[topology._slave_aliases[topology._getnodenamefor(key)]]
         return getattr(redisent, 'object')(infotype, key)
 
+    def register_script(self, script):
+        """
+        Register a Lua script specifying the ``keys`` it will touch.
+        Returns a ClusterScript object that is callable and hides the
+        complexity of dealing with scripts, keys, nodes and shas.
+        """
+        return ClusterScript(self, script)
+
+    def eval(self, script, numkeys, *keys_and_args):
+        """
+        Execute the Lua ``script`` on the master of the node its keys land
+        to, specifying the ``numkeys`` the script will touch and the key
+        names and argument values in ``keys_and_args``
+        """
+        topology = self.topology
+        node, keys = self._getscriptnodefor(topology, keys_and_args[:numkeys])
+        topology._track([(node, encode_key(key)) for key in keys])
+        try:
+            return topology.redises[node].eval(script, numkeys, *(keys + list(keys_and_args[numkeys:])))
+        finally:
+            self._evict(node, keys)
+
+    def evalsha(self, sha, numkeys, *keys_and_args):
+        """
+        Use the ``sha`` to execute a Lua script already loaded on the master
+        of the node its keys land to, specifying the ``numkeys`` the script
+        will touch and the key names and argument values in ``keys_and_args``
+        """
+        topology = self.topology
+        node, keys = self._getscriptnodefor(topology, keys_and_args[:numkeys])
+        topology._track([(node, encode_key(key)) for key in keys])
+        try:
+            return topology.redises[node].evalsha(sha, numkeys, *(keys + list(keys_and_args[numkeys:])))
+        finally:
+            self._evict(node, keys)
+
+    def _getscriptnodefor(self, topology, keys):
+        """
+        Return the node of ``topology`` the first of the ``keys`` of a script
+        lands to and the key names with their hash tag removed, checking they
+        all land to it
+        """
+        if not keys:
+            raise redis.DataError("rediscluster: Scripts need at least one key to be routed to a node")
+        node = None
+        names = []
+        for key in keys:
+            hkey, tag_start, (key,) = self._parse_hash_tag((key,))
+            hnode = topology._getnodenamefor(hkey)
+            if node is None:
+                node = hnode
+            elif hnode != node:
+                raise redis.DataError(
+                    "rediscluster: Keys of a script must land to the same node, "
+                    "%s lands to %s instead of %s (use hash tags)" % (nativestr(hkey), hnode, node))
+            names.append(key)
+        return node, names
+
+    def _execute_script(self, script, keys, args):
+        """
+        Run the ClusterScript ``script`` with EVALSHA on the node of ``keys``,
+        loading it first if it is not known to be there yet
+        """
+        topology = self.topology
+        node, keys = self._getscriptnodefor(topology, keys)
+        topology._track([(node, encode_key(key)) for key in keys])
+        redisent = topology.redises[node]
+        shas = topology._script_shas.setdefault(node, set())
+        args = keys + list(args)
+        if script.sha not in shas:
+            shas.add(redisent.script_load(script.script))
+        try:
+            return redisent.evalsha(script.sha, len(keys), *args)
+        except redis.exceptions.NoScriptError:
+            # the server was restarted, flushed or failed over
+            shas.discard(script.sha)
+            shas.add(redisent.script_load(script.script))
+            return redisent.evalsha(script.sha, len(keys), *args)
+        finally:
+            self._evict(node, keys)
+
+    def pipeline(self, transaction=False):
+        """
+        Return a new pipeline object that can queue multiple commands for
+        later execution. The commands are grouped by the redis server
+        they land to and each server is sent its commands in one round trip.
+
+        With ``transaction``, the commands are executed atomically with
+        MULTI / EXEC on a single node, all their keys having to land to it.
+        """
+        if transaction:
+            return StrictClusterTransaction(self)
+        return StrictClusterPipeline(self)
+
+    def transaction(self, func, *watches, **kwargs):
+        """
+        Convenience method for executing the callable ``func`` as a
+        transaction while watching all keys specified in ``watches``, retried
+        until none of them is modified in the meantime. The ``func`` callable
+        should expect a single argument which is a StrictClusterTransaction.
+        """
+        value_from_callable = kwargs.pop('value_from_callable', False)
+        watch_delay = kwargs.pop('watch_delay', None)
+        with self.pipeline(True) as pipe:
+            while True:
+                try:
+                    if watches:
+                        pipe.watch(*watches)
+                    func_value = func(pipe)
+                    exec_value = pipe.execute()
+                    return func_value if value_from_callable else exec_value
+                except redis.WatchError:
+                    if watch_delay is not None and watch_delay > 0:
+                        time.sleep(watch_delay)
+
+    def scan(self, cursor='0', match=None, count=None, type=None, parallel=False):
+        """
+        Incrementally return lists of key names across all the slaves, one
+        SCAN call per node. Also return a cursor to resume the scan from,
+        '0' once every node has been scanned entirely.
+
+        ``match`` allows for filtering the keys by pattern
+
+        ``count`` hints the number of keys each node returns per call
+
+        ``type`` filters the keys by data type (redis >= 6.0)
+
+        ``parallel`` scans all the nodes at the same time instead of one
+        after the other
+
+        A node reading from several replicas is scanned on one of them,
+        whose index is kept in the cursor.
+        """
+        topology = self.topology
+        cursors = topology._scan_cursors(cursor)
+        replies = self._execute_parallel(
+            topology._scan_calls(cursors if parallel else cursors[:1], match=match, count=count, type=type))
+        return topology._scan_result(cursors, replies)
+
+    def scan_iter(self, match=None, count=None, type=None, parallel=False, cursor='0'):
+        """
+        Make an iterator using the SCAN command on every slave so that the
+        client doesn't need to remember the cursor position. The keys are
+        fetched lazily, ``count`` at a time per node.
+
+        ``cursor`` allows for resuming a scan from a cursor returned by ``scan``
+        """
+        while True:
+            cursor, data = self.scan(cursor, match=match, count=count, type=type, parallel=parallel)
+            for item in data:
+                yield item
+            if cursor == '0':
+                break
+
     def _rc_brpoplpush(self, src, dst, timeout=0):
         """
         Pop a value off the tail of ``src``, push it on the head of ``dst``
@@ -334,10 +1424,16 @@ class StrictRedisCluster:
         the first set and all the successive sets.
         """
         args = list_or_args(src, args)
-        src_set = self.smembers(args.pop(0))
-        if src_set is not set([]):
-            for key in args:
-                src_set.difference_update(self.smembers(key))
+        result = self._execute_colocated('sdiff', args)
+        if result is not None:
+            return result
+
+        sets = self._execute_pipelined('smembers', [(key,) for key in args])
+        src_set = sets.pop(0)
+        for other in sets:
+            if not src_set:
+                break
+            src_set.difference_update(other)
         return src_set
 
     def _rc_sdiffstore(self, dst, src, *args):
@@ -346,33 +1442,54 @@ class StrictRedisCluster:
         set named ``dest``.  Returns the number of keys in the new set.
         """
         args = list_or_args(src, args)
-        result = self.sdiff(*args)
-        if result is not set([]):
-            return self.sadd(dst, *list(result))
-        return 0
+        result = self._execute_colocated('sdiffstore', [dst] + args)
+        if result is not None:
+            return result
+
+        others = args[1:]
+
+        def batches():
+            for members in self._sscan_batches(args[0]):
+                yield [member for member, flags in zip(members, self._ismember(others, members))
+                       if not any(flags)]
+        return self._store(dst, batches())
 
     def _rc_sinter(self, src, *args):
         """
-        Returns the members of the set resulting from the difference between
+        Returns the members of the set resulting from the intersection of
         the first set and all the successive sets.
         """
         args = list_or_args(src, args)
-        src_set = self.smembers(args.pop(0))
-        if src_set is not set([]):
-            for key in args:
-                src_set.intersection_update(self.smembers(key))
-        return src_set
+        result = self._execute_colocated('sinter', args)
+        if result is not None:
+            return result
+
+        # fetch only the smallest set and check its members against the others
+        keys = self._order_by_card(args)
+        if not keys:
+            return set()
+        alias, name = self._getkeyfor('smembers', keys[0])
+        members = list(self.redises[alias].smembers(name))
+        flags = self._ismember(keys[1:], members)
+        return set(member for member, found in zip(members, flags) if all(found))
 
     def _rc_sinterstore(self, dst, src, *args):
         """
-        Store the difference of sets ``src``,  ``args`` into a new
+        Store the intersection of sets ``src``,  ``args`` into a new
         set named ``dest``.  Returns the number of keys in the new set.
         """
         args = list_or_args(src, args)
-        result = self.sinter(*args)
-        if result is not set([]):
-            return self.sadd(dst, *list(result))
-        return 0
+        result = self._execute_colocated('sinterstore', [dst] + args)
+        if result is not None:
+            return result
+
+        keys = self._order_by_card(args)
+
+        def batches():
+            for members in self._sscan_batches(keys[0]) if keys else ():
+                yield [member for member, flags in zip(members, self._ismember(keys[1:], members))
+                       if all(flags)]
+        return self._store(dst, batches())
 
     def _rc_smove(self, src, dst, value):
         """
@@ -393,10 +1510,14 @@ class StrictRedisCluster:
         the first set and all the successive sets.
         """
         args = list_or_args(src, args)
-        src_set = self.smembers(args.pop(0))
-        if src_set is not set([]):
-            for key in args:
-                src_set.update(self.smembers(key))
+        result = self._execute_colocated('sunion', args)
+        if result is not None:
+            return result
+
+        sets = self._execute_pipelined('smembers', [(key,) for key in args])
+        src_set = sets.pop(0)
+        for other in sets:
+            src_set.update(other)
         return src_set
 
     def _rc_sunionstore(self, dst, src, *args):
@@ -405,25 +1526,191 @@ class StrictRedisCluster:
         set named ``dest``.  Returns the number of keys in the new set.
         """
         args = list_or_args(src, args)
-        result = self.sunion(*args)
-        if result is not set([]):
-            return self.sadd(dst, *list(result))
-        return 0
+        result = self._execute_colocated('sunionstore', [dst] + args)
+        if result is not None:
+            return result
+
+        return self._store(dst, (members for key in args for members in self._sscan_batches(key)))
+
+    def _order_by_card(self, keys):
+        """
+        Return the set ``keys`` ordered by cardinality with pipelined SCARD,
+        or an empty list if one of them is empty
+        """
+        cards = self._execute_pipelined('scard', [(key,) for key in keys])
+        if not all(cards):
+            return []
+        return [keys[i] for i in sorted(range(len(keys)), key=cards.__getitem__)]
+
+    def _ismember(self, keys, members):
+        """
+        Return for each of ``members`` the list of its SISMEMBER replies
+        for the sets ``keys``, sent in pipelines of about ``chunk_size``
+        commands
+        """
+        if not keys or not members:
+            return [[] for member in members]
+        flags = []
+        for chunk in _chunks(members, max(1, self.chunk_size // len(keys))):
+            replies = self._execute_pipelined(
+                'sismember', [(key, member) for key in keys for member in chunk])
+            n = len(chunk)
+            flags.extend(replies[j::n] for j in range(n))
+        return flags
+
+    def _sscan_batches(self, key):
+        "Yield the members of the set ``key`` in lists of about ``chunk_size`` members, with SSCAN"
+        alias, name = self._getkeyfor('sscan', key)
+        redisent = self.redises[alias]
+        cursor = 0
+        while True:
+            cursor, members = redisent.sscan(name, cursor, count=self.chunk_size)
+            if members:
+                yield members
+            if not int(cursor):
+                return
+
+    def _store(self, dst, batches, add='sadd', card='scard', width=1):
+        """
+        Replace the key ``dst`` by the elements yielded in lists by
+        ``batches``, as arguments of the ``add`` command taking ``width``
+        arguments per element. The elements are written in commands of at
+        most ``chunk_size`` elements to a temporary key of the node of
+        ``dst``, the pipeline being sent every ``buffer_size`` elements,
+        then the temporary key is renamed to ``dst``. Return the number of
+        elements stored, as counted by the ``card`` command.
+
+        The temporary key expires if the client dies before renaming it.
+        """
+        alias, name = self._getkeyfor(add, dst)
+        redisent = self.redises[alias]
+        tmp = 'rediscluster:store:%s' % uuid.uuid4().hex
+        try:
+            pipe = redisent.pipeline(transaction=False)
+            buffered = 0
+            for args in batches:
+                for chunk in _chunks(args, self.chunk_size * width):
+                    getattr(pipe, add)(tmp, *chunk)
+                buffered += len(args) // width
+                if buffered >= self.buffer_size:
+                    pipe.pexpire(tmp, _STORE_TTL).execute()
+                    buffered = 0
+            getattr(pipe.pexpire(tmp, _STORE_TTL), card)(tmp)
+            count = pipe.execute()[-1]
+            if count:
+                # the time to live of the temporary key is not kept by dst
+                redisent.pipeline().rename(tmp, name).persist(name).execute()
+            else:
+                redisent.delete(name)
+            return count
+        finally:
+            redisent.delete(tmp)
+
+    def _rc_zinterstore(self, dest, keys, aggregate=None):
+        """
+        Intersect multiple sorted sets specified by ``keys`` into
+        a new sorted set, ``dest``. Scores in the destination will be
+        aggregated based on the ``aggregate``, or SUM if none is provided.
+        """
+        return self._zstore('zinterstore', dest, keys, aggregate)
+
+    def _rc_zunionstore(self, dest, keys, aggregate=None):
+        """
+        Union multiple sorted sets specified by ``keys`` into
+        a new sorted set, ``dest``. Scores in the destination will be
+        aggregated based on the ``aggregate``, or SUM if none is provided.
+        """
+        return self._zstore('zunionstore', dest, keys, aggregate)
+
+    def _zstore(self, command, dest, keys, aggregate):
+        """
+        Emulate ``command``, zinterstore or zunionstore, on sorted sets
+        spread over several nodes: the sets are fetched in parallel, with
+        ZRANGE for the ones of at most ``chunk_size`` members and ZSCAN for
+        the others, their scores merged by the client and the result
+        written to ``dest`` in chunks
+        """
+        weighted = isinstance(keys, dict)
+        if weighted:
+            keys, weights = list(iterkeys(keys)), list(itervalues(keys))
+        else:
+            keys = list(keys)
+            weights = [1] * len(keys)
+        try:
+            merge = {'SUM': lambda x, y: x + y, 'MIN': min, 'MAX': max}[nativestr(aggregate or 'SUM').upper()]
+        except KeyError:
+            raise redis.DataError("rediscluster: Unknown aggregate %s" % aggregate)
+
+        aliases = self._getaliasesfor(command, [dest] + keys)
+        if len(aliases) == 1:
+            for alias, (positions, names) in iteritems(aliases):
+                sources = dict(zip(names[1:], weights)) if weighted else names[1:]
+                return getattr(self.redises[alias], command)(names[0], sources, aggregate)
+
+        cards = self._execute_pipelined('zcard', [(key,) for key in keys])
+        if command == 'zinterstore' and not all(cards):
+            return self._store(dest, (), 'zadd', 'zcard', 2)
+
+        small = [i for i, card in enumerate(cards) if card <= self.chunk_size]
+        calls = dict((i, (self._zscan_dict, (keys[i],))) for i, card in enumerate(cards) if card > self.chunk_size)
+        calls['small'] = (self._execute_pipelined, ('zrange', [(keys[i], 0, -1, False, True) for i in small]))
+        replies = self._execute_parallel(calls)
+        zsets = [None] * len(keys)
+        for i, reply in zip(small, replies.pop('small')):
+            zsets[i] = dict(reply)
+        for i, reply in iteritems(replies):
+            zsets[i] = reply
+
+        result = {}
+        if command == 'zunionstore':
+            for zset, weight in zip(zsets, weights):
+                for member, score in iteritems(zset):
+                    score *= weight
+                    result[member] = merge(result[member], score) if member in result else score
+        else:
+            order = sorted(range(len(keys)), key=cards.__getitem__)
+            result = dict((member, score * weights[order[0]]) for member, score in iteritems(zsets[order[0]]))
+            for i in order[1:]:
+                zset, weight = zsets[i], weights[i]
+                result = dict((member, merge(score, zset[member] * weight))
+                              for member, score in iteritems(result) if member in zset)
+
+        items = [v for member, score in iteritems(result) for v in (score, member)]
+        return self._store(dest, _chunks(items, self.chunk_size * 2), 'zadd', 'zcard', 2)
+
+    def _zscan_dict(self, key):
+        "Return the dict of member: score of the sorted set ``key``, read with ZSCAN"
+        alias, name = self._getkeyfor('zscan', key)
+        return dict(self.redises[alias].zscan_iter(name, count=self.chunk_size))
 
     def _rc_mset(self, mapping):
         "Sets each key in the ``mapping`` dict to its corresponding value"
-        result = True
-        for k, v in iteritems(mapping):
-            result = result and self.set(k, v)
-        return result
+        replies = self._execute_parallel(dict(
+            (alias, (self.redises[alias].mset, (items,)))
+            for alias, items in iteritems(self._split_mapping('mset', mapping))))
+        return all(itervalues(replies))
 
     def _rc_msetnx(self, mapping):
         """
         Sets each key in the ``mapping`` dict to its corresponding value if
         none of the keys are already set
         """
-        for k in iterkeys(mapping):
-            if self.exists(k):
+        mappings = self._split_mapping('msetnx', mapping)
+        if len(mappings) == 1:
+            for alias, items in iteritems(mappings):
+                return self.redises[alias].msetnx(items)
+
+        def exists(redisent, names):
+            pipe = redisent.pipeline(transaction=False)
+            for name in names:
+                pipe.exists(name)
+            return pipe.execute()
+
+        replies = self._execute_parallel(dict(
+            (alias, (exists, (self.redises[alias], list(items))))
+            for alias, items in iteritems(mappings)))
+        for reply in itervalues(replies):
+            if any(reply):
                 return False
 
         return self._rc_mset(mapping)
@@ -433,75 +1720,193 @@ class StrictRedisCluster:
         Returns a list of values ordered identically to ``*args``
         """
         args = list_or_args(keys, args)
-        result = []
-        for key in args:
-            result.append(self.get(key))
-        return result
+        topology = self.topology
+        values = self._mget(topology, args)
+        previous = topology._previous
+        if previous is not None:
+            # during a migration, read the keys missing from their new node on their previous node
+            moved = []
+            for i, value in enumerate(values):
+                if value is None:
+                    hkey, tag_start, (key,) = topology._parse_hash_tag((args[i],))
+                    if topology._moved_from(hkey, key) is not None:
+                        moved.append(i)
+            if moved:
+                for i, value in zip(moved, self._mget(previous, [args[i] for i in moved])):
+                    values[i] = value
+        return values
+
+    def _mget(self, topology, keys):
+        "Return the values of ``keys`` read from the slaves of ``topology``, one MGET per node"
+        aliases = topology._getaliasesfor('mget', keys)
+        replies = self._execute_parallel(dict(
+            (alias, (topology.redises[alias].mget, (names,)))
+            for alias, (positions, names) in iteritems(aliases)))
+        return topology._merge(aliases, replies, len(keys))
 
     def _rc_rename(self, src, dst):
         """
         Rename key ``src`` to ``dst``
+
+        Keys of the same redis server are renamed with RENAME. Otherwise the
+        key is moved with DUMP and RESTORE REPLACE, keeping its time to live,
+        or copied in pipelined chunks when the servers can't restore it
         """
         if src == dst:
             return self.rename(src + "{" + src + "}", src)
-        if not self.exists(src):
+
+        src_alias, src_name = self._getkeyfor('rename', src)
+        dst_alias, dst_name = self._getkeyfor('rename', dst)
+        src_redis = self.redises[src_alias]
+        dst_redis = self.redises[dst_alias]
+        if src_redis is dst_redis:
+            return src_redis.rename(src_name, dst_name)
+
+        pipe = src_redis.pipeline(transaction=False)
+        pipe.dump(src_name).pttl(src_name)
+        data, pttl = pipe.execute(raise_on_error=False)
+        if isinstance(data, redis.ResponseError):
+            return self._rename_by_type(src_redis, src_name, dst_redis, dst_name)
+        if data is None:
             return self.rename(src + "{" + src + "}", src)
 
-        self.delete(dst)
-        ktype = self.type(src)
-        kttl = self.ttl(src)
+        try:
+            # dst is only replaced once the payload is restored
+            dst_redis.execute_command('RESTORE', dst_name, max(pttl or 0, 0), data, 'REPLACE')
+        except redis.ResponseError:
+            # e.g. RDB version mismatch between the servers, or no REPLACE before redis 3.0
+            return self._rename_by_type(src_redis, src_name, dst_redis, dst_name)
+        return bool(src_redis.delete(src_name))
 
-        if ktype == b('none'):
-            return False
+    def _rename_by_type(self, src_redis, src, dst_redis, dst):
+        """
+        Copy the key ``src`` of ``src_redis`` to ``dst`` on ``dst_redis``
+        according to its type, writing ``chunk_size`` elements per command
+        in a single pipeline, then delete ``src``
+        """
+        pipe = src_redis.pipeline(transaction=False)
+        ktype, kttl = pipe.type(src).ttl(src).execute()
 
+        pipe = dst_redis.pipeline(transaction=False)
+        pipe.delete(dst)
         if ktype == b('string'):
-            self.set(dst, self.get(src))
+            pipe.set(dst, src_redis.get(src))
         elif ktype == b('hash'):
-            self.hmset(dst, self.hgetall(src))
+            for chunk in _chunks(list(iteritems(src_redis.hgetall(src))), self.chunk_size):
+                pipe.hmset(dst, dict(chunk))
         elif ktype == b('list'):
-            for k in self.lrange(src, 0, -1):
-                self.rpush(dst, k)
+            for chunk in _chunks(src_redis.lrange(src, 0, -1), self.chunk_size):
+                pipe.rpush(dst, *chunk)
         elif ktype == b('set'):
-            for k in self.smembers(src):
-                self.sadd(dst, k)
+            for chunk in _chunks(list(src_redis.smembers(src)), self.chunk_size):
+                pipe.sadd(dst, *chunk)
         elif ktype == b('zset'):
-            for k, v in self.zrange(src, 0, -1, withscores=True):
-                self.zadd(dst, v, k)
+            for chunk in _chunks(src_redis.zrange(src, 0, -1, withscores=True), self.chunk_size):
+                pipe.zadd(dst, *[v for member, score in chunk for v in (score, member)])
+        else:
+            return False
 
         # Handle keys with an expire time set
-        kttl = -1 if kttl is None or kttl < 0 else int(kttl)
-        if kttl != -1:
-            self.expire(dst, kttl)
+        if kttl is not None and kttl > 0:
+            pipe.expire(dst, kttl)
+        pipe.execute()
 
-        return self.delete(src)
+        return bool(src_redis.delete(src))
+
+    def _rc_delete(self, *names):
+        "Delete one or more keys specified by ``names``"
+        return self._delete_keys('DEL', names)
+
+    def _rc_unlink(self, *names):
+        "Unlink one or more keys specified by ``names``, freeing their memory in the background"
+        return self._delete_keys('UNLINK', names)
+
+    def _delete_keys(self, command, names):
+        """
+        Send the ``command``, DEL or UNLINK, of the keys ``names`` to their
+        nodes at the same time, in chunks of ``chunk_size`` keys pipelined,
+        and return the number of keys removed
+        """
+        def delete(redisent, names):
+            pipe = redisent.pipeline(transaction=False)
+            for chunk in _chunks(names, self.chunk_size):
+                pipe.execute_command(command, *chunk)
+            return sum(pipe.execute())
+
+        topology = self.topology
+        calls = dict(
+            (alias, (delete, (topology.redises[alias], names)))
+            for alias, (positions, names) in iteritems(topology._getaliasesfor('delete', names)))
+        previous = topology._previous
+        if previous is not None:
+            # during a migration, also delete the keys not moved yet from their previous node
+            moved = [name for name in names if topology._moved_from(topology._parse_hash_tag((name,))[0]) is not None]
+            for alias, (positions, names) in iteritems(previous._getaliasesfor('delete', moved)):
+                calls[('previous', alias)] = (delete, (previous.redises[alias], names))
+        return sum(itervalues(self._execute_parallel(calls)))
 
     def _rc_renamenx(self, src, dst):
         "Rename key ``src`` to ``dst`` if ``dst`` doesn't already exist"
+        src_alias, src_name = self._getkeyfor('renamenx', src)
+        dst_alias, dst_name = self._getkeyfor('renamenx', dst)
+        if self.redises[src_alias] is self.redises[dst_alias]:
+            return self.redises[src_alias].renamenx(src_name, dst_name)
+
         if self.exists(dst):
             return False
 
         return self._rc_rename(src, dst)
 
     def _rc_keys(self, pattern='*'):
-        "Returns a list of keys matching ``pattern``"
-
-        result = []
-        for alias, redisent in iteritems(self.redises):
-            if alias.find('_slave') == -1:
-                continue
+        """
+        Returns a list of keys matching ``pattern``
 
-            result.extend(redisent.keys(pattern))
+        The keys are collected with SCAN rather than KEYS so that
+        the redis servers are not blocked while they are listed.
+        """
+        return list(set(self.scan_iter(match=pattern, count=1000, parallel=True)))
+
+    def _masters(self):
+        "Return a dict of node: master client, one node per redis server"
+        masters = {}
+        seen = set()
+        for node in sorted(self._slave_aliases):
+            redisent = self.redises[node]
+            if id(redisent) not in seen:
+                seen.add(id(redisent))
+                masters[node] = redisent
+        return masters
+
+    def _rc_script_load(self, script):
+        "Load the Lua ``script`` on every master at the same time and return its SHA1"
+        masters = self._masters()
+        replies = self._execute_parallel(dict(
+            (node, (redisent.script_load, (script,))) for node, redisent in iteritems(masters)))
+        sha = next(itervalues(replies))
+        for node in self._slave_aliases:
+            self._script_shas.setdefault(node, set()).add(sha)
+        return sha
+
+    def _rc_script_exists(self, *shas):
+        """
+        Check if the Lua scripts of SHA1 ``shas`` are loaded on every master.
+        Returns a list of boolean values
+        """
+        replies = self._execute_parallel(dict(
+            (node, (redisent.script_exists, shas)) for node, redisent in iteritems(self._masters())))
+        return [all(exists) for exists in zip(*itervalues(replies))]
 
-        return result
+    def _rc_script_flush(self):
+        "Flush all the Lua scripts of every master"
+        self._execute_parallel(dict(
+            (node, (redisent.script_flush, ())) for node, redisent in iteritems(self._masters())))
+        self._script_shas.clear()
+        return True
 
     def _rc_dbsize(self):
         "Returns the number of keys in the current database"
 
-        result = 0
-        for alias, redisent in iteritems(self.redises):
-            if alias.find('_slave') == -1:
-                continue
-
-            result += redisent.dbsize()
-
-        return result
+        replies = self._execute_parallel(dict(
+            (alias, (redisent.dbsize, ()))
+            for alias, redisent in iteritems(self.redises) if alias.find('_slave') >= 0))
+        return sum(itervalues(replies))
@@ -0,0 +1,317 @@
+# -*- coding: UTF-8 -*-
+import redis
+from redis._compat import iteritems, nativestr
+
+from rediscluster.client_cache import encode_key, written_keys
+
+
+class StrictClusterPipeline(object):
+    """
+    Pipeline for the cluster of redis servers
+
+    Commands are buffered, grouped by the redis server they would be routed to
+    by ``StrictRedisCluster`` (masters for writes, slaves for reads) and sent
+    with a single redis-py pipeline per server when ``execute`` is called.
+    The responses are returned in the order the commands were issued.
+
+    Commands spanning multiple nodes can only be pipelined when their keys
+    share a hash tag, e.g. "bar{zap}", except delete and unlink, sent to
+    the node of each of their keys, their replies being summed up.
+
+    The commands are routed with the topology of the cluster at the time
+    the first one is buffered, until the pipeline is reset.
+    """
+
+    def __init__(self, cluster):
+        self.cluster = cluster
+        self.command_stack = []
+        self.topology = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.reset()
+
+    def __len__(self):
+        return len(self.command_stack)
+
+    def __getattr__(self, name):
+        """
+        Magic method to buffer all redis commands
+        - string name The name of the command called.
+
+        The method is built on first use and cached on the class.
+        """
+        if name.startswith('__'):
+            raise AttributeError(name)
+
+        def command(self, *args, **kwargs):
+            return self.pipeline_execute_command(name, *args, **kwargs)
+
+        setattr(self.__class__, name, command)
+        return getattr(self, name)
+
+    def __setitem__(self, name, value):
+        "Set the value at key ``name`` to ``value``"
+        return self.set(name, value)
+
+    def pipeline_execute_command(self, name, *args, **kwargs):
+        """
+        Stage the command ``name`` on the redis server its key lands to.
+        Returns the current Pipeline object back so commands can be
+        chained together, e.g. pipe.set('foo', 'bar').incr('baz').execute()
+        """
+        topology = self._topology()
+        if name in topology._loop_keys:
+            raise redis.DataError("rediscluster: Command %s Not Supported in pipeline" % name)
+
+        if name in topology._multi_keys:
+            # split among the nodes of the keys when executed
+            self.command_stack.append((None, name, args, kwargs))
+            return self
+
+        hkey, tag_start, args = topology._parse_hash_tag(args)
+        if name in topology._tag_keys and not tag_start:
+            raise redis.DataError("rediscluster: Command %s Not Supported in pipeline (each key name has its own node)" % name)
+
+        self.command_stack.append((topology._getaliasfor(name, hkey), name, args, kwargs))
+        return self
+
+    def reset(self):
+        "Empty the buffered commands and release the topology"
+        self.command_stack = []
+        self.topology = None
+
+    def _topology(self):
+        "Return the topology of the cluster the buffered commands are routed with"
+        if self.topology is None:
+            self.topology = self.cluster.topology
+        return self.topology
+
+    def _pipelines(self):
+        """
+        Return a dict of alias: redis-py pipeline loaded with the buffered
+        commands of that redis server and a dict of alias: positions of
+        these commands in the stack
+        """
+        topology = self._topology()
+        pipes = {}
+        positions = {}
+        # aliases sharing a redis server, e.g. a master without slaves and its
+        # slave alias, share its pipeline so their commands keep their order
+        servers = {}
+        for i, (alias, name, args, kwargs) in enumerate(self.command_stack):
+            if alias is None:
+                # one command per node of the keys, their replies are summed up
+                calls = [(node, 'execute_command', [topology._multi_keys[name]] + names)
+                         for node, (key_positions, names) in iteritems(topology._getaliasesfor(name, args))]
+            else:
+                calls = [(alias, name, args)]
+            for alias, command, command_args in calls:
+                alias = servers.setdefault(id(topology.redises[alias]), alias)
+                if alias not in pipes:
+                    pipes[alias] = topology.redises[alias].pipeline(transaction=False)
+                    positions[alias] = []
+                getattr(pipes[alias], command)(*command_args, **kwargs)
+                positions[alias].append(i)
+        return pipes, positions
+
+    def execute(self, raise_on_error=True):
+        """
+        Send all the buffered commands, one pipeline per redis server,
+        and return their responses in the order they were issued
+        """
+        if not self.command_stack:
+            return []
+
+        self._track(self.command_stack)
+        pipes, positions = self._pipelines()
+        try:
+            replies = self.cluster._execute_parallel(dict(
+                (alias, (pipe.execute, (False,))) for alias, pipe in iteritems(pipes)), raise_on_error=False)
+            return self._responses(positions, replies, raise_on_error)
+        finally:
+            self._invalidate(self.command_stack)
+            self.reset()
+
+    def _responses(self, positions, replies, raise_on_error):
+        """
+        Return the responses of the buffered commands in the order they were
+        issued, from the dict of alias: replies of the pipeline of every
+        redis server. The commands of a pipeline that failed as a whole, e.g.
+        on a connection error, get its exception as response. With
+        ``raise_on_error``, the first error in that order is raised instead,
+        once every pipeline has been executed, as with redis-py
+        """
+        response = [None] * len(self.command_stack)
+        for alias, reply in iteritems(replies):
+            if isinstance(reply, Exception):
+                reply = [reply] * len(positions[alias])
+            for i, res in zip(positions[alias], reply):
+                previous = response[i]
+                if previous is not None and not isinstance(res, Exception):
+                    # command split among several nodes
+                    res = previous if isinstance(previous, Exception) else previous + res
+                response[i] = res
+        if raise_on_error:
+            for res in response:
+                if isinstance(res, Exception):
+                    raise res
+        return response
+
+    def _written(self, commands):
+        "Return the (alias, key name) of the keys written by ``commands``, a list of (alias, name, args, kwargs)"
+        topology = self._topology()
+        indexes = []
+        for alias, name, args, kwargs in commands:
+            if name not in topology._write_keys or name in topology._readonly_keys:
+                continue
+            for key in written_keys(name, args):
+                if alias is None:
+                    indexes.append(topology._getkeyfor(name, key))
+                else:
+                    indexes.append((alias, key))
+        return [(alias, encode_key(key)) for alias, key in indexes]
+
+    def _invalidate(self, commands):
+        "Drop the cached replies of the keys written by ``commands``"
+        cache = self.cluster.client_cache
+        if cache is not None:
+            cache.invalidate(self._written(commands))
+
+    def _track(self, commands):
+        "Record the keys written by ``commands`` during a migration, not to be read from their previous node"
+        topology = self._topology()
+        if topology._previous is not None:
+            topology._track(self._written(commands))
+
+
+class StrictClusterTransaction(StrictClusterPipeline):
+    """
+    Transaction for the cluster of redis servers
+
+    All the keys of a transaction must land to the same node, e.g. by
+    sharing a hash tag "bar{zap}", "baz{zap}". That node is the one of the
+    first key watched or queued, and a DataError is raised as soon as a key
+    lands to another one. The commands are sent to its master wrapped in
+    MULTI / EXEC when ``execute`` is called.
+
+    As with redis-py, the commands issued after ``watch`` are executed right
+    away until ``multi`` is called, and ``execute`` raises a WatchError when
+    a watched key was modified in the meantime.
+    """
+
+    def __init__(self, cluster):
+        super(StrictClusterTransaction, self).__init__(cluster)
+        self.node = None
+        self.pipe = None
+
+    def watch(self, *names):
+        "Watch the key names ``names`` for changes until the transaction is executed"
+        keys = []
+        hkeys = []
+        for name in names:
+            hkey, tag_start, (key,) = self._topology()._parse_hash_tag((name,))
+            hkeys.append(hkey)
+            keys.append(key)
+        return self._pipeline(hkeys).watch(*keys)
+
+    def unwatch(self):
+        "Stop watching all the key names"
+        if self.pipe is not None:
+            return self.pipe.unwatch()
+        return True
+
+    def multi(self):
+        "Buffer the commands issued after ``watch`` again, until ``execute``"
+        if self.pipe is not None:
+            self.pipe.multi()
+
+    def discard(self):
+        "Empty the buffered commands and stop watching"
+        self.reset()
+
+    def pipeline_execute_command(self, name, *args, **kwargs):
+        """
+        Stage the command ``name`` in the transaction, or execute it right
+        away after ``watch`` and before ``multi``. Returns the current
+        Transaction object back when staged
+        """
+        topology = self._topology()
+        if (name in topology._loop_keys or name in topology._dont_hash or
+                (name not in topology._write_keys and name not in topology._read_keys)):
+            raise redis.DataError("rediscluster: Command %s Not Supported in transaction" % name)
+
+        if name in topology._multi_keys:
+            hkeys = []
+            keys = []
+            for key in args:
+                hkey, tag_start, (key,) = topology._parse_hash_tag((key,))
+                hkeys.append(hkey)
+                keys.append(key)
+            args = tuple(keys)
+        else:
+            hkey, tag_start, args = topology._parse_hash_tag(args)
+            if name in topology._tag_keys and not tag_start:
+                raise redis.DataError("rediscluster: Command %s Not Supported in transaction (each key name has its own node)" % name)
+            hkeys = [hkey]
+
+        pipe = self._pipeline(hkeys)
+        if pipe.watching and not pipe.explicit_transaction:
+            self._track([(self.node, name, args, kwargs)])
+            try:
+                return getattr(pipe, name)(*args, **kwargs)
+            finally:
+                self._invalidate([(self.node, name, args, kwargs)])
+
+        getattr(pipe, name)(*args, **kwargs)
+        self.command_stack.append((self.node, name, args, kwargs))
+        return self
+
+    def reset(self):
+        "Empty the buffered commands, stop watching and release the node"
+        self.command_stack = []
+        if self.pipe is not None:
+            self.pipe.reset()
+        self.node = None
+        self.pipe = None
+        self.topology = None
+
+    def _pipeline(self, hkeys):
+        """
+        Return the redis-py transactional pipeline of the master of the node
+        of the transaction, checking the hash keys ``hkeys`` all land to it
+        """
+        topology = self._topology()
+        node = self.node
+        for hkey in hkeys:
+            hnode = topology._getnodenamefor(hkey)
+            if node is None:
+                node = hnode
+            elif hnode != node:
+                raise redis.DataError(
+                    "rediscluster: Keys of a transaction must land to the same node, "
+                    "%s lands to %s instead of %s (use hash tags)" % (nativestr(hkey), hnode, node))
+        if node is None:
+            raise redis.DataError("rediscluster: No key given")
+
+        if self.pipe is None:
+            self.node = node
+            self.pipe = topology.redises[node].pipeline(transaction=True)
+        return self.pipe
+
+    def execute(self, raise_on_error=True):
+        """
+        Send the buffered commands to the master of the node of the
+        transaction wrapped in MULTI / EXEC and return their responses
+        """
+        if self.pipe is None:
+            return []
+
+        self._track(self.command_stack)
+        try:
+            return self.pipe.execute(raise_on_error=raise_on_error)
+        finally:
+            self._invalidate(self.command_stack)
+            self.reset()
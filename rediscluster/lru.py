@@ -0,0 +1,49 @@
+# -*- coding: UTF-8 -*-
+import threading
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    Thread safe dict holding at most ``maxsize`` items, the least recently
+    used items are evicted first
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def get(self, key, default=None):
+        "Return the value of ``key``, marking it as the most recently used"
+        with self.lock:
+            try:
+                value = self.data.pop(key)
+            except KeyError:
+                return default
+            self.data[key] = value
+            return value
+
+    def set(self, key, value):
+        "Set ``key`` to ``value``, evicting the least recently used item if full"
+        with self.lock:
+            self.data.pop(key, None)
+            self.data[key] = value
+            if len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        "Remove ``key`` and return its value"
+        with self.lock:
+            return self.data.pop(key, default)
+
+    def clear(self):
+        "Remove all the items"
+        with self.lock:
+            self.data.clear()
@@ -0,0 +1,158 @@
+# -*- coding: UTF-8 -*-
+import binascii
+import bisect
+import hashlib
+import struct
+
+from redis._compat import b, iteritems
+
+
+class ModuloPartitioner(object):
+    """
+    Map keys to nodes with crc32 modulo the number of nodes
+
+    This is the default partitioner, compatible with rediscluster-php.
+    Changing the number of nodes remaps almost every key.
+    """
+
+    def __init__(self, nodes):
+        self.nodes = list(nodes)
+        self.no_servers = len(self.nodes)
+
+    def get_node(self, key):
+        "Return the node name where ``key`` would land to"
+        return self.nodes[abs(binascii.crc32(b(key)) & 0xffffffff) % self.no_servers]
+
+
+class KetamaPartitioner(object):
+    """
+    Map keys to nodes with a ketama consistent hash ring
+
+    Every node is given ``points`` points on the ring (md5 based, as in
+    libketama) and a key lands to the node owning the first point following
+    the hash of the key. Adding a node only moves about 1/N of the keys.
+    """
+
+    def __init__(self, nodes, points=160):
+        self.nodes = list(nodes)
+        self.ring = {}
+        for node in self.nodes:
+            for i in range(points // 4):
+                digest = hashlib.md5(b('%s-%d' % (node, i))).digest()
+                for point in struct.unpack('<4I', digest):
+                    self.ring[point] = node
+        self.points = sorted(self.ring)
+
+    def get_node(self, key):
+        "Return the node name where ``key`` would land to"
+        point = struct.unpack('<I', hashlib.md5(b(key)).digest()[:4])[0]
+        i = bisect.bisect(self.points, point)
+        if i == len(self.points):
+            i = 0
+        return self.ring[self.points[i]]
+
+
+def _crc16_table():
+    table = []
+    for i in range(256):
+        crc = i << 8
+        for j in range(8):
+            crc = ((crc << 1) ^ 0x1021 if crc & 0x8000 else crc << 1) & 0xffff
+        table.append(crc)
+    return table
+
+
+CRC16_TABLE = _crc16_table()
+
+
+def crc16(data):
+    "Return the CRC16 (XMODEM) checksum of ``data``, as used by Redis Cluster"
+    crc = 0
+    for byte in bytearray(data):
+        crc = ((crc << 8) & 0xffff) ^ CRC16_TABLE[((crc >> 8) ^ byte) & 0xff]
+    return crc
+
+
+class SlotPartitioner(object):
+    """
+    Map keys to nodes through a table of 16384 hash slots, as in Redis Cluster
+
+    A key lands to the node owning the slot CRC16(key) % 16384.
+    ``slots`` is a dict of node name: list of (first slot, last slot) ranges,
+    the slots are split evenly among the nodes in contiguous ranges by default.
+    Use ``rebalance`` or ``resized`` to compute the assignment for a new list
+    of nodes that moves the fewest slots, i.e. about 1/N of the keys when a
+    node is added.
+    """
+
+    SLOTS = 16384
+
+    def __init__(self, nodes, slots=None):
+        self.nodes = list(nodes)
+        if slots is None:
+            slots = self.rebalance({}, self.nodes)
+
+        self.table = [None] * self.SLOTS
+        for node, ranges in iteritems(slots):
+            for first, last in ranges:
+                for slot in range(first, last + 1):
+                    self.table[slot] = node
+        if None in self.table:
+            raise ValueError(
+                "rediscluster: slot %s is not assigned to any node" % self.table.index(None))
+
+    def get_node(self, key):
+        "Return the node name where ``key`` would land to"
+        return self.table[crc16(b(key)) % self.SLOTS]
+
+    def get_slots(self):
+        "Return the slot assignment as a dict of node name: list of slot ranges"
+        return _slot_ranges(self.nodes, self.table)
+
+    def resized(self, nodes):
+        "Return the partitioner of ``nodes`` moving the fewest slots of this one"
+        return self.__class__(nodes, self.rebalance(self.get_slots(), nodes))
+
+    @classmethod
+    def rebalance(cls, slots, nodes):
+        """
+        Return a slot assignment spreading the slots evenly over ``nodes``,
+        keeping as many slots of the ``slots`` assignment as possible in place
+        """
+        nodes = list(nodes)
+        table = [None] * cls.SLOTS
+        for node, ranges in iteritems(slots):
+            if node in nodes:
+                for first, last in ranges:
+                    for slot in range(first, last + 1):
+                        table[slot] = node
+
+        quota = dict((node, cls.SLOTS // len(nodes) + (1 if i < cls.SLOTS % len(nodes) else 0))
+                     for i, node in enumerate(nodes))
+        owned = dict((node, 0) for node in nodes)
+        free = []
+        for slot, node in enumerate(table):
+            if node is None or owned[node] >= quota[node]:
+                free.append(slot)
+                table[slot] = None
+            else:
+                owned[node] += 1
+
+        free.reverse()
+        for node in nodes:
+            while owned[node] < quota[node]:
+                table[free.pop()] = node
+                owned[node] += 1
+
+        return _slot_ranges(nodes, table)
+
+
+def _slot_ranges(nodes, table):
+    "Return the dict of node name: list of slot ranges of the slots ``table``"
+    slots = dict((node, []) for node in nodes)
+    first = 0
+    for slot in range(1, len(table) + 1):
+        if slot == len(table) or table[slot] != table[first]:
+            slots.setdefault(table[first], []).append((first, slot - 1))
+            first = slot
+    return slots
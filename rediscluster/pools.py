@@ -0,0 +1,79 @@
+# -*- coding: UTF-8 -*-
+import threading
+
+import redis
+from redis._compat import iteritems
+
+
+class PoolRegistry(object):
+    """
+    Thread safe registry of the connection pools of the redis servers
+
+    A pool is created on first use for each server, database and set of
+    connection options, and shared by every client asking for the same one.
+    Besides the redis-py connection options (``socket_timeout``,
+    ``socket_connect_timeout``, ``socket_keepalive``, ``password``, ...),
+    the pool is set up with:
+    - ``max_connections``, the maximum number of connections to the server
+    - ``blocking``, wait for a connection to be released when there are
+      already ``max_connections`` in use instead of raising a ConnectionError
+    - ``blocking_timeout``, the number of seconds to wait for a connection
+      before raising a ConnectionError, 20 by default
+
+    The options of ``StrictRedis`` that are not connection options
+    (``unix_socket_path``, ``ssl``, ``charset``, ``errors``) are translated
+    the way ``StrictRedis`` does.
+    """
+
+    def __init__(self):
+        self.pools = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.pools)
+
+    def get_pool(self, host='localhost', port=6379, db=0, **options):
+        "Return the connection pool of the redis server ``host``:``port``"
+        key = (host, int(port), db, repr(sorted(iteritems(options))))
+        with self.lock:
+            pool = self.pools.get(key)
+            if pool is None:
+                pool = self.pools[key] = self._make_pool(host, int(port), db, **options)
+            return pool
+
+    def _make_pool(self, host, port, db, max_connections=None, blocking=False,
+                   blocking_timeout=20, unix_socket_path=None, ssl=False, charset=None, errors=None,
+                   **connection_kwargs):
+        if charset is not None:
+            connection_kwargs['encoding'] = charset
+        if errors is not None:
+            connection_kwargs['encoding_errors'] = errors
+        if unix_socket_path is not None:
+            # the TCP and SSL options don't apply to unix sockets
+            for option in list(connection_kwargs):
+                if option.startswith(('socket_connect_timeout', 'socket_keepalive', 'ssl_')):
+                    del connection_kwargs[option]
+            connection_kwargs.update(path=unix_socket_path, connection_class=redis.UnixDomainSocketConnection)
+        else:
+            connection_kwargs.update(host=host, port=port)
+            if ssl:
+                connection_kwargs['connection_class'] = redis.SSLConnection
+            else:
+                for option in list(connection_kwargs):
+                    if option.startswith('ssl_'):
+                        del connection_kwargs[option]
+        if blocking:
+            return redis.BlockingConnectionPool(
+                max_connections=max_connections or 50, timeout=blocking_timeout, db=db, **connection_kwargs)
+        return redis.ConnectionPool(max_connections=max_connections, db=db, **connection_kwargs)
+
+    def disconnect(self):
+        "Close the connections of all the pools and forget them"
+        with self.lock:
+            for pool in self.pools.values():
+                pool.disconnect()
+            self.pools.clear()
+
+
+# registry shared by the clients of the process created with shared_pools=True
+shared_registry = PoolRegistry()
@@ -0,0 +1,173 @@
+# -*- coding: UTF-8 -*-
+import itertools
+import random
+import threading
+import time
+import zlib
+
+import redis
+
+from rediscluster.client_cache import encode_key
+
+
+class LatencyTracker(object):
+    """
+    Thread safe exponentially weighted moving average (EWMA) of the latency
+    of redis clients
+
+    A client whose latency spikes above ``spike_factor`` times its average
+    (and ``spike_threshold`` seconds), or which fails to reply, is deemed
+    unhealthy for ``cooldown`` seconds.
+    """
+
+    def __init__(self, decay=0.2, cooldown=5.0, spike_factor=4.0, spike_threshold=0.01):
+        self.decay = decay
+        self.cooldown = cooldown
+        self.spike_factor = spike_factor
+        self.spike_threshold = spike_threshold
+        self.latencies = {}
+        self.cooled = {}
+        self.lock = threading.Lock()
+
+    def get(self, redisent):
+        "Return the average latency of ``redisent`` in seconds, None if unknown"
+        return self.latencies.get(redisent)
+
+    def record(self, redisent, elapsed):
+        "Add the latency ``elapsed`` measured on ``redisent`` to its average"
+        with self.lock:
+            latency = self.latencies.get(redisent)
+            if latency is None:
+                self.latencies[redisent] = elapsed
+                return
+            if elapsed > self.spike_threshold and elapsed > latency * self.spike_factor:
+                self.cooled[redisent] = time.time() + self.cooldown
+            self.latencies[redisent] = latency + self.decay * (elapsed - latency)
+
+    def fail(self, redisent):
+        "Mark ``redisent`` as unhealthy for the cooldown period"
+        with self.lock:
+            self.cooled[redisent] = time.time() + self.cooldown
+
+    def healthy(self, redisent):
+        "Return whether ``redisent`` is out of any cooldown period"
+        until = self.cooled.get(redisent)
+        if until is None:
+            return True
+        if until <= time.time():
+            with self.lock:
+                self.cooled.pop(redisent, None)
+            return True
+        return False
+
+
+class ReplicaSet(object):
+    """
+    Redis client spreading the commands over several replicas of a server
+
+    It is used in place of the slave client of a node having several read
+    replicas. Every command is sent to one replica, chosen by ``strategy``:
+    - ``round_robin``, each replica in turn
+    - ``least_outstanding``, the replica with the fewest commands in flight
+    - ``latency``, a random replica weighted by the inverse of its moving
+      average latency, so that faster replicas get more commands
+    - ``fastest``, the replica with the lowest moving average latency
+
+    The latencies are tracked by ``tracker``, a LatencyTracker possibly
+    shared with other replica sets and fed by the PING of the cluster
+    client. With the ``latency`` and ``fastest`` strategies, replicas in
+    cooldown after a latency spike or an error are skipped, unless all of
+    them are.
+    """
+
+    STRATEGIES = ('round_robin', 'least_outstanding', 'latency', 'fastest')
+    # strategies relying on the latency tracker
+    LATENCY_STRATEGIES = ('latency', 'fastest')
+    # commands whose cursor is only valid on the replica that returned it,
+    # always sent to the same replica for a given key
+    CURSOR_COMMANDS = ('sscan', 'hscan', 'zscan')
+
+    def __init__(self, redises, strategy='round_robin', tracker=None):
+        if strategy not in self.STRATEGIES:
+            raise ValueError("rediscluster: Unknown read strategy %s" % strategy)
+        self.redises = list(redises)
+        self.strategy = strategy
+        self.tracker = tracker or LatencyTracker()
+        self.outstanding = [0] * len(self.redises)
+        self.lock = threading.Lock()
+        self._counter = itertools.count()
+
+    @property
+    def latency(self):
+        "The list of the average latencies of the replicas, None if unknown"
+        return [self.tracker.get(redisent) for redisent in self.redises]
+
+    def __len__(self):
+        return len(self.redises)
+
+    def __getattr__(self, name):
+        """
+        Magic method to handle all redis commands
+        - string name The name of the command called.
+
+        The method is built on first use and cached on the instance.
+        """
+        if name.startswith('__'):
+            raise AttributeError(name)
+
+        def command(*args, **kwargs):
+            if name in self.CURSOR_COMMANDS:
+                i = (zlib.crc32(encode_key(args[0])) & 0xffffffff) % len(self.redises)
+            else:
+                i = self.choose()
+            return self.execute(i, getattr(self.redises[i], name), *args, **kwargs)
+
+        self.__dict__[name] = command
+        return command
+
+    def choose(self):
+        "Return the index of the replica the next command has to be sent to"
+        n = len(self.redises)
+        start = next(self._counter) % n
+        candidates = [(start + i) % n for i in range(n)]
+
+        if self.strategy == 'least_outstanding':
+            return min(candidates, key=self.outstanding.__getitem__)
+        if self.strategy in self.LATENCY_STRATEGIES:
+            tracker = self.tracker
+            candidates = [i for i in candidates if tracker.healthy(self.redises[i])] or candidates
+            latency = self.latency
+            for i in candidates:
+                if latency[i] is None:
+                    # measure every replica first
+                    return i
+            if self.strategy == 'fastest':
+                return min(candidates, key=latency.__getitem__)
+            weights = [1.0 / max(latency[i], 1e-6) for i in candidates]
+            point = random.random() * sum(weights)
+            for i, weight in zip(candidates, weights):
+                point -= weight
+                if point < 0:
+                    return i
+        return candidates[0]
+
+    def execute(self, i, func, *args, **kwargs):
+        "Call ``func`` of the replica ``i``, tracking the commands in flight and the failures"
+        with self.lock:
+            self.outstanding[i] += 1
+        try:
+            return func(*args, **kwargs)
+        except (redis.ConnectionError, redis.TimeoutError):
+            self.tracker.fail(self.redises[i])
+            raise
+        finally:
+            with self.lock:
+                self.outstanding[i] -= 1
+
+    def pick(self):
+        "Return the client of the replica the next command would be sent to"
+        return self.redises[self.choose()]
+
+    def pipeline(self, *args, **kwargs):
+        "Return a pipeline of the replica the next command would be sent to"
+        return self.pick().pipeline(*args, **kwargs)
@@ -0,0 +1,28 @@
+# -*- coding: UTF-8 -*-
+import hashlib
+
+from rediscluster.client_cache import encode_key
+
+
+class ClusterScript(object):
+    """
+    Executable Lua script returned by ``StrictRedisCluster.register_script``
+
+    The script is run with EVALSHA on the master of the node its first key
+    lands to, every key having to land to that same node, e.g. by sharing a
+    hash tag. It is loaded on a node the first time it runs there, the SHA1
+    of the scripts loaded on every node being cached by the cluster client,
+    and loaded again when the node replies NOSCRIPT, e.g. after a restart or
+    a failover.
+    """
+
+    def __init__(self, cluster, script):
+        self.cluster = cluster
+        self.script = script
+        self.sha = hashlib.sha1(encode_key(script)).hexdigest()
+
+    def __call__(self, keys=[], args=[], client=None):
+        "Execute the script on the node of ``keys``, passing any required ``args``"
+        if client is None:
+            client = self.cluster
+        return client._execute_script(self, keys, args)
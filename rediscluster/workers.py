@@ -0,0 +1,74 @@
+# -*- coding: UTF-8 -*-
+import threading
+
+from redis._compat import Queue
+
+# number of threads of a pool created without max_workers
+DEFAULT_MAX_WORKERS = 32
+
+
+class WorkerPool(object):
+    """
+    Thread safe pool of at most ``max_workers`` daemon threads running the
+    calls submitted to it
+
+    The threads are started on demand and kept waiting for the next calls
+    until ``close`` is called, the pool starting threads again if it is
+    used afterwards. A call submitted from one of the threads of the pool
+    is run at once by that thread, so that nested calls never wait for a
+    thread that is waiting for them.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or DEFAULT_MAX_WORKERS
+        self.tasks = Queue()
+        self.threads = []
+        self.idle = 0
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def __len__(self):
+        return len(self.threads)
+
+    def submit(self, func, *args):
+        "Run ``func(*args)`` on a thread of the pool, its result being discarded"
+        if getattr(self.local, 'pool', None) is self:
+            func(*args)
+            return
+        with self.lock:
+            self.tasks.put((func, args))
+            if self.idle < self.tasks.qsize() and len(self.threads) < self.max_workers:
+                thread = threading.Thread(target=self._work, args=(self.tasks,))
+                thread.daemon = True
+                thread.start()
+                self.threads.append(thread)
+
+    def _work(self, tasks):
+        self.local.pool = self
+        while True:
+            # the threads stopped by close only drain the calls submitted before
+            with self.lock:
+                current = tasks is self.tasks
+                if current:
+                    self.idle += 1
+            task = tasks.get()
+            if current:
+                with self.lock:
+                    if tasks is self.tasks:
+                        self.idle -= 1
+            if task is None:
+                return
+            func, args = task
+            try:
+                func(*args)
+            except Exception:
+                pass
+
+    def close(self):
+        "Stop the threads of the pool once they are done with the calls submitted"
+        with self.lock:
+            for thread in self.threads:
+                self.tasks.put(None)
+            self.tasks = Queue()
+            self.threads = []
+            self.idle = 0
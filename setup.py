@@ -30,9 +30,12 @@ setup(
     url='http://github.com/salimane/rediscluster-py',
     download_url=('http://pypi.python.org/packages/source/r/rediscluster/rediscluster-%s.tar.gz' % __version__),
     install_requires=[
-        'redis>=2.4.0',
+        'redis>=2.10,<3',
         'hiredis',
     ],
+    extras_require={
+        'asyncio': ['aioredis>=2.0,<2.1'],
+    },
     author='Salimane Adjao Moustapha',
     author_email='me@salimane.com',
     maintainer='Salimane Adjao Moustapha',
@@ -41,6 +44,9 @@ setup(
               'data store', 'sharding'],
     license=license,
     packages=['rediscluster'],
+    entry_points={
+        'console_scripts': ['rediscluster-migrate = rediscluster.migrate:main'],
+    },
     test_suite='tests.all_tests',
     classifiers=[
         'Development Status :: 4 - Beta',
@@ -49,10 +55,7 @@ setup(
         'License :: OSI Approved :: MIT License',
         'Operating System :: OS Independent',
         'Programming Language :: Python',
-        'Programming Language :: Python :: 2.6',
         'Programming Language :: Python :: 2.7',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.2',
-        'Programming Language :: Python :: 3.3',
     ]
 )
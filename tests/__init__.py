@@ -2,8 +2,16 @@ import unittest
 
 from tests.cluster_commands import ClusterCommandsTestCase
 
+try:
+    from tests.async_commands import AsyncClusterCommandsTestCase
+except (SyntaxError, ImportError, TypeError):
+    # the asyncio client needs python 3, and aioredis 2.0 fails to import on python >= 3.11
+    AsyncClusterCommandsTestCase = None
+
 
 def all_tests():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(ClusterCommandsTestCase))
+    if AsyncClusterCommandsTestCase is not None:
+        suite.addTest(unittest.makeSuite(AsyncClusterCommandsTestCase))
     return suite
@@ -0,0 +1,153 @@
+import asyncio
+import unittest
+
+from redis._compat import b
+
+try:
+    from rediscluster.async_client import AsyncStrictRedisCluster
+except (ImportError, TypeError):
+    # the asyncio client needs aioredis, which fails to import on python >= 3.11
+    AsyncStrictRedisCluster = None
+import rediscluster
+from tests import config
+
+
+@unittest.skipIf(AsyncStrictRedisCluster is None, "aioredis is not installed")
+class AsyncClusterCommandsTestCase(unittest.TestCase):
+    def get_client(self, **kwargs):
+        return AsyncStrictRedisCluster(cluster=config.cluster, db=4, **kwargs).initialize()
+
+    def run_client(self, coro_function, **kwargs):
+        async def run():
+            client = await self.get_client(**kwargs)
+            await client.flushdb()
+            try:
+                return await coro_function(client)
+            finally:
+                await client.flushdb()
+                await client.close()
+        return asyncio.run(run())
+
+    def test_get_and_set(self):
+        async def test(client):
+            self.assertEqual(await client.get('a'), None)
+            self.assert_(await client.set('a', 'foo'))
+            self.assertEqual(await client.get('a'), b('foo'))
+            self.assertEqual(await client['a'], b('foo'))
+            with self.assertRaises(KeyError):
+                await client['b']
+        self.run_client(test)
+
+    def test_routing(self):
+        async def test(client):
+            for i in range(20):
+                await client.set('k%d' % i, i)
+            sync = rediscluster.StrictRedisCluster(cluster=config.cluster, db=4)
+            self.assertEqual(
+                sync.mget(['k%d' % i for i in range(20)]), [b(str(i)) for i in range(20)])
+            await client.set('bar{foo}', 'bar')
+            self.assertEqual(sync.get('bar{foo}'), b('bar'))
+        self.run_client(test)
+
+    def test_slave_options(self):
+        async def run():
+            # the slaves discovered are set up as their master
+            cluster = {'nodes': dict((k, dict(v, socket_timeout=5)) for k, v in config.cluster['nodes'].items())}
+            client = await AsyncStrictRedisCluster(cluster=cluster, db=4).initialize()
+            try:
+                for alias in client.cluster['slaves']:
+                    kwargs = client.redises[alias].connection_pool.connection_kwargs
+                    self.assertEqual(kwargs['socket_timeout'], 5)
+                    self.assertEqual(kwargs['db'], 4)
+            finally:
+                await client.close()
+        asyncio.run(run())
+
+    def test_mset_mget(self):
+        async def test(client):
+            d = dict(('k%d' % i, str(i)) for i in range(50))
+            self.assert_(await client.msetnx(d))
+            self.assert_(not await client.msetnx({'k1': 'x', 'new': 'x'}))
+            self.assertEqual(
+                await client.mget(sorted(d) + ['new']), [b(d[k]) for k in sorted(d)] + [None])
+            self.assert_(await client.mset({'k1': 'x', 'new': 'x'}))
+            self.assertEqual(await client.mget(['new', 'k1']), [b('x'), b('x')])
+        self.run_client(test, mastersonly=True)
+
+    def test_sets(self):
+        async def test(client):
+            await client.sadd('a', '1', '2', '3')
+            await client.sadd('b', '2', '3', '4')
+            self.assertEqual(await client.sdiff('a', 'b'), set([b('1')]))
+            self.assertEqual(await client.sinter('a', 'b'), set([b('2'), b('3')]))
+            self.assertEqual(await client.sunion('a', 'b'), set([b('1'), b('2'), b('3'), b('4')]))
+            self.assertEqual(await client.sunionstore('c', 'a', 'b'), 4)
+            self.assertEqual(await client.sinterstore('c', 'a', 'b'), 2)
+            self.assertEqual(await client.smembers('c'), set([b('2'), b('3')]))
+        self.run_client(test, mastersonly=True)
+
+    def test_rename(self):
+        async def test(client):
+            await client.rpush('a', '1', '2')
+            await client.expire('a', 100)
+            self.assert_(await client.rename('a', 'b'))
+            self.assertEqual(await client.lrange('b', 0, -1), [b('1'), b('2')])
+            self.assert_(0 < await client.ttl('b') <= 100)
+            self.assertEqual(await client.exists('a'), 0)
+            await client.set('c', 'c')
+            self.assert_(not await client.renamenx('b', 'c'))
+            # hash tags route the destination like any other key
+            for dst in ('d{a}', 'd{b}', 'd{c}'):
+                self.assert_(await client.rename('b', dst))
+                self.assertEqual(await client.lrange(dst, 0, -1), [b('1'), b('2')])
+                self.assert_(await client.rename(dst, 'b'))
+        self.run_client(test, mastersonly=True)
+
+    def test_admin_and_keys(self):
+        async def test(client):
+            for data in (await client.ping()).values():
+                self.assertEqual(data, True)
+            for i in range(30):
+                await client.set('k%d' % i, i)
+            self.assertEqual(await client.dbsize(), 30)
+            self.assertEqual(len(await client.keys('k*')), 30)
+            keys = [key async for key in client.scan_iter(match='k1*', count=5)]
+            self.assertEqual(len(keys), 11)
+        self.run_client(test, mastersonly=True)
+
+    def test_pipeline(self):
+        async def test(client):
+            pipe = client.pipeline()
+            for i in range(10):
+                pipe.set('k%d' % i, i)
+            pipe.incr('k0')
+            self.assertEqual(await pipe.execute(), [True] * 10 + [1])
+            pipe.get('k0').get('k9')
+            self.assertEqual(await pipe.execute(), [b('1'), b('9')])
+            # every command is sent before the first error is raised
+            pipe.lpush('k0', 'a').set('k1', 'x').set('k2', 'x')
+            with self.assertRaises(Exception):
+                await pipe.execute()
+            self.assertEqual(await client.mget(['k1', 'k2']), [b('x'), b('x')])
+        self.run_client(test, mastersonly=True)
+
+    def test_delete(self):
+        async def test(client):
+            keys = ['k%d' % i for i in range(20)]
+            for key in keys:
+                await client.set(key, key)
+            self.assertEqual(len(client._getaliasesfor('delete', keys)), 2)
+            self.assertEqual(await client.delete(*(keys[:10] + ['missing'])), 10)
+            self.assertEqual(await client.unlink(*keys[10:]), 10)
+            self.assertEqual(await client.dbsize(), 0)
+            for key in keys:
+                await client.set(key, key)
+            self.assertEqual(await client.pipeline().delete(*keys).execute(), [20])
+            self.assertEqual(await client.dbsize(), 0)
+        self.run_client(test, mastersonly=True)
+
+    def test_not_supported(self):
+        async def test(client):
+            with self.assertRaises(rediscluster.DataError):
+                await client.zunionstore('a', ['b', 'c'])
+        self.run_client(test)
@@ -2,18 +2,20 @@ from distutils.version import StrictVersion
 import unittest
 import datetime
 import time
+import threading
 import binascii
 
 from redis._compat import (unichr, u, b, ascii_letters, iteritems, iterkeys,
-                           itervalues)
+                           itervalues, nativestr)
 from redis.client import parse_info
+import redis
 import rediscluster
 from tests import config
 
 
 class ClusterCommandsTestCase(unittest.TestCase):
-    def get_client(self, cls=rediscluster.StrictRedisCluster, mastersonly=False):
-        return cls(cluster=config.cluster, db=4, mastersonly=mastersonly)
+    def get_client(self, cls=rediscluster.StrictRedisCluster, mastersonly=False, **kwargs):
+        return cls(cluster=config.cluster, db=4, mastersonly=mastersonly, **kwargs)
 
     def setUp(self):
         self.client = self.get_client()
@@ -51,6 +53,20 @@ class ClusterCommandsTestCase(unittest.TestCase):
                 continue
             self.assertEquals(client.cluster['nodes'][alias], client.cluster['slaves'][alias + '_slave'])
 
+    def test_connect_errors(self):
+        cluster = {'nodes': {
+            'node_1': config.cluster['nodes']['node_1'],
+            'node_2': {'host': '127.0.0.1', 'port': 1},
+            'node_3': {'host': '127.0.0.1', 'port': 2},
+        }}
+        try:
+            rediscluster.StrictRedisCluster(cluster=cluster, db=4, connect_timeout=5)
+        except rediscluster.ConnectionError as e:
+            self.assert_("'port': 1}" in str(e))
+            self.assert_("'port': 2}" in str(e))
+        else:
+            self.fail("ConnectionError not raised")
+
     def test_getnodefor(self):
         self.client['bar'] = 'foo'
         node = self.client.getnodefor('bar')
@@ -58,6 +74,642 @@ class ClusterCommandsTestCase(unittest.TestCase):
         rd = StrictRedis(db=4, **config.cluster['nodes'][iterkeys(node)[0]])
         self.assertEquals(self.client['bar'], rd['bar'])
 
+    def test_modulo_partitioner(self):
+        for key in ('foo', 'bar', 'zap', 'a' * 100):
+            self.assertEquals(
+                self.client._getnodenamefor(key),
+                'node_' + str((abs(binascii.crc32(b(key)) & 0xffffffff) % self.client.no_servers) + 1))
+
+    def test_ketama_partitioner(self):
+        nodes = ['node_1', 'node_2', 'node_3', 'node_4']
+        keys = ['key:%d' % i for i in range(10000)]
+        ring = rediscluster.KetamaPartitioner(nodes)
+        self.assertEquals(set(ring.get_node(k) for k in keys), set(nodes))
+        grown = rediscluster.KetamaPartitioner(nodes + ['node_5'])
+        moved = [k for k in keys if ring.get_node(k) != grown.get_node(k)]
+        self.assert_(len(moved) < len(keys) * 0.3)
+        self.assertEquals(set(grown.get_node(k) for k in moved), set(['node_5']))
+
+    def test_slot_partitioner(self):
+        from rediscluster.partitioners import crc16
+        self.assertEquals(crc16(b('123456789')), 0x31C3)
+        nodes = ['node_1', 'node_2', 'node_3', 'node_4']
+        keys = ['key:%d' % i for i in range(10000)]
+        table = rediscluster.SlotPartitioner(nodes)
+        self.assertEquals(table.get_slots()['node_1'], [(0, 4095)])
+        self.assertEquals(table.get_node('foo'), 'node_3')  # slot 12182
+        slots = rediscluster.SlotPartitioner.rebalance(table.get_slots(), nodes + ['node_5'])
+        grown = rediscluster.SlotPartitioner(nodes + ['node_5'], slots=slots)
+        moved = [k for k in keys if table.get_node(k) != grown.get_node(k)]
+        self.assert_(len(moved) < len(keys) * 0.25)
+        self.assertEquals(set(grown.get_node(k) for k in moved), set(['node_5']))
+        self.assertRaises(ValueError, rediscluster.SlotPartitioner, nodes, {'node_1': [(0, 10)]})
+
+    def test_client_partitioner(self):
+        for partitioner in (rediscluster.KetamaPartitioner, rediscluster.SlotPartitioner):
+            client = self.get_client(partitioner=partitioner)
+            client.flushdb()
+            for i in range(20):
+                client.set('k%d' % i, i)
+            self.assertEquals(client.mget(['k%d' % i for i in range(20)]), [b(str(i)) for i in range(20)])
+            for i in range(20):
+                self.assertEquals(
+                    list(client.getnodefor('k%d' % i)), [client.partitioner.get_node('k%d' % i)])
+            client.flushdb()
+
+    def test_route_cache(self):
+        client = self.get_client(route_cache_size=2)
+        for key in ('foo', 'bar', 'zap', 'foo'):
+            self.assertEquals(client._getnodenamefor(key), self.client._getnodenamefor(key))
+        self.assertEquals(len(client._route_cache), 2)
+        self.assert_('foo' in client._route_cache)
+        self.assert_('bar' not in client._route_cache)
+        client['foo'] = 'bar'
+        self.assertEquals(client['foo'], b('bar'))
+
+    def test_command_dispatch(self):
+        self.client.set('a', 'foo')
+        self.assert_('set' in vars(rediscluster.StrictRedisCluster))
+        self.assertEquals(self.get_client().get('a'), b('foo'))
+        self.assertRaises(rediscluster.DataError, self.client.not_a_command, 'a')
+        self.assertRaises(rediscluster.DataError, self.client.sort, 'a')
+        self.assertRaises(AttributeError, getattr, self.client, '__not_a_command__')
+
+    def test_pool_options(self):
+        client = self.get_client(pool_options={'max_connections': 5, 'socket_timeout': 3, 'socket_keepalive': True})
+        for alias, redisent in iteritems(client.redises):
+            pool = redisent.connection_pool
+            self.assertEquals(pool.max_connections, 5)
+            self.assertEquals(pool.connection_kwargs['socket_timeout'], 3)
+            self.assertEquals(pool.connection_kwargs['socket_keepalive'], True)
+        client.set('a', 'foo')
+        self.assertEquals(client.get('a'), b('foo'))
+
+        cluster = dict(config.cluster, nodes=dict(config.cluster['nodes']))
+        cluster['nodes']['node_1'] = dict(cluster['nodes']['node_1'], socket_timeout=1)
+        client = rediscluster.StrictRedisCluster(
+            cluster=cluster, db=9, pool_options={'blocking': True, 'max_connections': 2, 'socket_timeout': 3})
+        pool = client.redises['node_1'].connection_pool
+        self.assert_(isinstance(pool, redis.BlockingConnectionPool))
+        self.assertEquals(pool.connection_kwargs['socket_timeout'], 1)
+        self.assertEquals(client.redises['node_1_slave'].connection_pool.connection_kwargs['socket_timeout'], 1)
+        self.assertEquals(client.redises['node_2'].connection_pool.connection_kwargs['socket_timeout'], 3)
+
+    def test_pool_options_translation(self):
+        registry = rediscluster.PoolRegistry()
+        pool = registry.get_pool(unix_socket_path='/tmp/redis.sock', db=2, charset='latin-1', errors='replace',
+                                 socket_keepalive=True, socket_timeout=1)
+        self.assert_(pool.connection_class is redis.UnixDomainSocketConnection)
+        self.assertEquals(pool.connection_kwargs, {
+            'path': '/tmp/redis.sock', 'db': 2, 'encoding': 'latin-1', 'encoding_errors': 'replace',
+            'socket_timeout': 1})
+        self.assertEquals(pool.make_connection().path, '/tmp/redis.sock')
+        pool = registry.get_pool(host='127.0.0.1', port=6380, ssl=True, ssl_ca_certs='/tmp/ca.pem')
+        self.assert_(pool.connection_class is redis.SSLConnection)
+        self.assertEquals(pool.connection_kwargs['ssl_ca_certs'], '/tmp/ca.pem')
+        pool = registry.get_pool(host='127.0.0.1', port=6380, ssl_ca_certs='/tmp/ca.pem')
+        self.assert_(pool.connection_class is redis.Connection)
+        self.assert_('ssl_ca_certs' not in pool.connection_kwargs)
+
+    def test_shared_pools(self):
+        clients = [self.get_client(shared_pools=True) for i in range(2)] + [self.get_client()]
+        for alias in clients[0].redises:
+            self.assert_(clients[0].redises[alias].connection_pool is clients[1].redises[alias].connection_pool)
+            self.assert_(clients[0].redises[alias].connection_pool is not clients[2].redises[alias].connection_pool)
+        registry = rediscluster.PoolRegistry()
+        client = self.get_client(shared_pools=registry)
+        self.assertEquals(len(registry), len(set(id(r) for r in itervalues(client.redises))))
+        registry.disconnect()
+        self.assertEquals(len(registry), 0)
+
+    def test_failover(self):
+        def get_client(**kwargs):
+            cluster = {'nodes': dict((k, dict(v)) for k, v in iteritems(config.cluster['nodes']))}
+            return rediscluster.StrictRedisCluster(cluster=cluster, db=4, **kwargs)
+        master = self.client.redises['node_1']
+        master_port = master.connection_pool.connection_kwargs['port']
+
+        # master down, its slave has been promoted already
+        client = get_client(failover_attempts=2, client_cache=rediscluster.ClientCache())
+        client.redises['node_1'] = redis.StrictRedis(port=1)
+        client.redises['node_1_slave'] = redis.StrictRedis(port=master_port, db=4)
+        self.assertEquals(client.check_health(), [])
+        self.assertEquals(client.check_health(), ['node_1'])
+        self.assert_(client.redises['node_1'] is client.redises['node_1_slave'])
+        self.assertEquals(client.cluster['nodes']['node_1']['port'], master_port)
+        self.assertEquals(client.check_health(), [])
+        # the invalidation messages are listened to on the new master
+        self.assert_(client.redises['node_1'].connection_pool in [listener.pool for listener in client._listeners])
+        client.close()
+        keys = [key for key in ('k%d' % i for i in range(20)) if client._getnodenamefor(key) == 'node_1']
+        for key in keys:
+            client.set(key, key)
+            self.assertEquals(master.get(key), b(key))
+
+        # master down, its slave is not promoted by the client unless asked to
+        client = get_client(failover_attempts=1)
+        slave = client.redises['node_1_slave']
+        slave_port = slave.connection_pool.connection_kwargs['port']
+        if slave_port != master_port:
+            client.redises['node_1'] = redis.StrictRedis(port=1)
+            self.assertEquals(client.check_health(), [])
+            self.assertEquals(nativestr(slave.info('replication')['role']), 'slave')
+
+        # master demoted to a slave of another server
+        client = get_client()
+        if slave_port != master_port:
+            client.redises['node_1'] = client.redises['node_1_slave']
+            self.assertEquals(client.check_health(), ['node_1'])
+            self.assertEquals(client.redises['node_1'].connection_pool.connection_kwargs['port'], master_port)
+            self.assertEquals(client.redises['node_1_slave'].connection_pool.connection_kwargs['port'], master_port)
+
+        # background checks
+        client = get_client(health_check_interval=0.01, failover_attempts=1)
+        client.redises['node_2'] = redis.StrictRedis(port=1)
+        client.redises['node_2_slave'] = self.client.redises['node_2']
+        for i in range(100):
+            if client.redises['node_2'] is self.client.redises['node_2']:
+                break
+            time.sleep(0.01)
+        client.close()
+        self.assert_(client.redises['node_2'] is self.client.redises['node_2'])
+
+    def test_slaves_from_info(self):
+        info = {'connected_slaves': 3,
+                'slave0': {'ip': '10.0.0.1', 'port': 6380, 'state': 'online'},
+                'slave1': {'ip': '10.0.0.2', 'port': 6380, 'state': 'wait_bgsave'},
+                'slave2': '10.0.0.3,6381,online'}
+        self.assertEquals(self.client._getslavesfrominfo(info), [
+            {'host': '10.0.0.1', 'port': 6380}, {'host': '10.0.0.3', 'port': '6381'}])
+        self.assertEquals(self.client._getslavefrominfo(info), {'host': '10.0.0.1', 'port': 6380})
+        self.assertEquals(self.client._getslavefrominfo({'connected_slaves': 0}), {})
+
+    def test_read_strategies(self):
+        from rediscluster.replicas import ReplicaSet
+        for strategy in ReplicaSet.STRATEGIES:
+            client = self.get_client(read_from_master=True, read_strategy=strategy, latency_check_interval=None)
+            client.set('a', 'foo')
+            time.sleep(0.1)
+            readers = client.redises[client._slave_aliases[client._getnodenamefor('a')]]
+            self.assert_(isinstance(readers, ReplicaSet))
+            self.assert_(client.redises[client._getnodenamefor('a')] in readers.redises)
+            # the latency is measured with PING for the strategies relying on it
+            if strategy in ReplicaSet.LATENCY_STRATEGIES:
+                self.assert_(None not in readers.latency)
+            latency = readers.latency
+            for i in range(10):
+                self.assertEquals(client.get('a'), b('foo'))
+            self.assertEquals(readers.latency, latency)
+            self.assertEquals(readers.outstanding, [0] * len(readers))
+            self.assertEquals(client.pipeline().get('a').execute(), [b('foo')])
+
+        readers = ReplicaSet([self.client.redises['node_1'], self.client.redises['node_1_slave']],
+                             'least_outstanding')
+        readers.outstanding[0] = 2
+        self.assertEquals([readers.choose() for i in range(3)], [1, 1, 1])
+        readers = ReplicaSet(readers.redises, 'round_robin')
+        self.assertEquals([readers.choose() for i in range(4)], [0, 1, 0, 1])
+        self.assertRaises(ValueError, ReplicaSet, readers.redises, 'random')
+
+    def test_replica_cursors(self):
+        from rediscluster.replicas import ReplicaSet
+        client = self.get_client(read_from_master=True)
+        master = self.get_client(mastersonly=True)
+        keys = ['k%d' % i for i in range(50)]
+        for key in keys:
+            master.set(key, key)
+        master.sadd('s', *keys)
+        master.zadd('z', **dict((key, i) for i, key in enumerate(keys)))
+        time.sleep(0.1)
+        # every scan is kept on the replica its cursor comes from
+        cursor, data = client.scan(count=5)
+        for node_cursor in cursor.split(','):
+            alias, replica, position = node_cursor.rsplit(':', 2)
+            self.assert_(isinstance(client.redises[alias], ReplicaSet))
+        self.assertEquals(sorted(client.scan_iter(count=5)), sorted(b(key) for key in keys + ['s', 'z']))
+        self.assertEquals(set(m for batch in client._sscan_batches('s') for m in batch), set(b(key) for key in keys))
+        self.assertEquals(len(client._zscan_dict('z')), len(keys))
+        members = set()
+        cursor = 0
+        while True:
+            cursor, data = client.sscan('s', cursor, count=5)
+            members.update(data)
+            if not cursor:
+                break
+        self.assertEquals(members, set(b(key) for key in keys))
+        # the admin commands are sent to every replica
+        pings = client.ping()
+        for alias, redisent in iteritems(client.redises):
+            if isinstance(redisent, ReplicaSet):
+                self.assertEquals(pings[alias], [True] * len(redisent))
+            else:
+                self.assertEquals(pings[alias], True)
+        master.delete(*(keys + ['s', 'z']))
+
+    def test_latency_tracking(self):
+        from rediscluster.replicas import LatencyTracker, ReplicaSet
+        client = self.get_client(read_from_master=True, read_strategy='fastest', latency_cooldown=60)
+        latencies = client.check_latency()
+        self.assert_(len(latencies) >= len(config.cluster['nodes']))
+        for latency in itervalues(latencies):
+            self.assert_(latency >= 0)
+
+        tracker = LatencyTracker(cooldown=60, spike_threshold=0.01)
+        fast, slow = self.client.redises['node_1'], self.client.redises['node_1_slave']
+        readers = ReplicaSet([slow, fast], 'fastest', tracker)
+        tracker.record(slow, 0.002)
+        tracker.record(fast, 0.001)
+        self.assertEquals([readers.choose() for i in range(3)], [1, 1, 1])
+        # a latency spike cools the replica down
+        tracker.record(fast, 0.5)
+        self.assert_(not tracker.healthy(fast))
+        self.assertEquals([readers.choose() for i in range(3)], [0, 0, 0])
+        tracker.cooled[fast] = time.time()
+        self.assert_(tracker.healthy(fast))
+        # all the replicas cooling down, the fastest is still used
+        tracker.fail(slow)
+        tracker.fail(fast)
+        self.assertEquals(readers.choose(), 0)
+        # the other strategies ignore the cooldown
+        readers = ReplicaSet([slow, fast], 'round_robin', tracker)
+        self.assertEquals([readers.choose() for i in range(4)], [0, 1, 0, 1])
+
+        # the latency is refreshed in the background
+        client = self.get_client(read_strategy='latency', latency_check_interval=0.01)
+        server = client.redises['node_1']
+        client.latency_tracker.latencies.pop(server)
+        time.sleep(0.1)
+        self.assert_(client.latency_tracker.get(server) is not None)
+        client.close()
+
+    def test_client_cache_policies(self):
+        cache = rediscluster.ClientCache(maxsize=2, policy='lru')
+        cache.set('a', 1, 'a')
+        cache.set('b', 2, 'b')
+        self.assertEquals(cache.get('a'), 1)
+        cache.set('c', 3, 'c')
+        self.assertEquals((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+
+        cache = rediscluster.ClientCache(maxsize=2, policy='lfu')
+        cache.set('a', 1, 'a')
+        cache.set('b', 2, 'b')
+        cache.get('b')
+        cache.get('b')
+        cache.get('a')
+        cache.set('c', 3, 'c')
+        self.assertEquals((cache.get('a'), cache.get('b'), cache.get('c')), (None, 2, 3))
+
+        cache = rediscluster.ClientCache(ttl=0.05)
+        cache.set('a', 1, 'a')
+        self.assertEquals(cache.get('a'), 1)
+        time.sleep(0.06)
+        self.assertEquals(cache.get('a'), None)
+        self.assertEquals(len(cache), 0)
+
+        cache = rediscluster.ClientCache(prefixes=['conf:'])
+        self.assert_(cache.cacheable('conf:a') and not cache.cacheable('a'))
+        generation = cache.generation
+        cache.set('a', 1, 'x')
+        cache.set('b', 1, 'x')
+        cache.invalidate(['x'])
+        self.assertEquals(len(cache), 0)
+        cache.set('a', 1, 'x', generation)
+        self.assertEquals(cache.get('a'), None)
+        self.assertRaises(ValueError, rediscluster.ClientCache, policy='random')
+
+    def test_client_cache(self):
+        cache = rediscluster.ClientCache(maxsize=100)
+        client = self.get_client(client_cache=cache)
+        try:
+            for listener in client._listeners:
+                self.assert_(listener.ready.wait(5))
+            client.set('a', 'foo')
+            client.hmset('h{a}', {'f': 'v'})
+            # let the invalidation messages of these writes arrive
+            time.sleep(0.1)
+            self.assertEquals(client.get('a'), b('foo'))
+            self.assertEquals(client.hgetall('h{a}'), {b('f'): b('v')})
+            self.assertEquals(client.hget('h{a}', 'f'), b('v'))
+            self.assertEquals(len(cache), 3)
+            self.assertEquals(client.get('a'), b('foo'))
+            self.assertEquals(len(cache), 3)
+            # written by another client
+            self.client.set('a', 'bar')
+            self.client.hset('h{a}', 'f', 'w')
+            for i in range(100):
+                if not len(cache):
+                    break
+                time.sleep(0.01)
+            self.assertEquals(len(cache), 0)
+            self.assertEquals(client.get('a'), b('bar'))
+            self.assertEquals(client.hget('h{a}', 'f'), b('w'))
+        finally:
+            client.close()
+
+    def test_client_cache_aliases(self):
+        # node_3 is an alias of the second server
+        servers = config.cluster['nodes']
+        cluster = {'nodes': dict(('node_%d' % i, dict(servers['node_%d' % min(i, 2)])) for i in range(1, 4))}
+        cache = rediscluster.ClientCache(maxsize=100)
+        client = rediscluster.StrictRedisCluster(cluster=cluster, db=4, client_cache=cache)
+        try:
+            self.assertEquals(len(client._listeners), 2)
+            for listener in client._listeners:
+                self.assert_(listener.ready.wait(5))
+            keys = [key for key in ('k%d' % i for i in range(20)) if client._getnodenamefor(key) == 'node_3']
+            client.set(keys[0], 'v1')
+            time.sleep(0.1)
+            self.assertEquals(client.get(keys[0]), b('v1'))
+            self.assertEquals(len(cache), 1)
+            # written by another client
+            client.redises['node_3'].set(keys[0], 'v2')
+            for i in range(100):
+                if not len(cache):
+                    break
+                time.sleep(0.01)
+            self.assertEquals(client.get(keys[0]), b('v2'))
+        finally:
+            client.close()
+
+    def test_client_cache_write_through(self):
+        cache = rediscluster.ClientCache(maxsize=100)
+        client = self.get_client(client_cache=cache, mastersonly=True)
+        client.close()
+        for listener in client._listeners:
+            listener.join()
+        # without invalidation messages, the writes of this client are still seen
+        for value in ('1', '2'):
+            client.set('a', value)
+            self.assertEquals(client.get('a'), b(value))
+            self.assertEquals(client.get('a'), b(value))
+        client.hset('h', 'f', 'v')
+        self.assertEquals(client.hgetall('h'), {b('f'): b('v')})
+        client['h2'] = 'x'
+        self.assertEquals(client['h2'], b('x'))
+        client.rename('h', 'h2')
+        self.assertEquals(client.get('a'), b('2'))
+        self.assertEquals(client.hgetall('h'), {})
+        self.assertEquals(client.hgetall('h2'), {b('f'): b('v')})
+        client.mset({'a': '3', 'b': '3'})
+        self.assertEquals(client.get('a'), b('3'))
+        client.expire('a', 100)
+        client.delete('a')
+        self.assertEquals(client.get('a'), None)
+        client.pipeline().set('a', '4').execute()
+        self.assertEquals(client.get('a'), b('4'))
+        client.eval("return redis.call('INCR', KEYS[1])", 1, 'a')
+        self.assertEquals(client.get('a'), b('5'))
+        client.register_script("return redis.call('INCR', KEYS[1])")(keys=['a'])
+        self.assertEquals(client.get('a'), b('6'))
+        client.set('b{a}', '1')
+        self.assertEquals(client.get('b{a}'), b('1'))
+        client.evalsha(client.script_load("return redis.call('INCR', KEYS[1])"), 1, 'b{a}')
+        self.assertEquals(client.get('b{a}'), b('2'))
+        client.set('a', '4')
+        client.flushdb()
+        self.assertEquals(len(cache), 0)
+        self.assertEquals(client.get('a'), None)
+        self.client.set('a', '5')
+        self.assertEquals(client.get('a'), None)
+
+    def test_reload_topology(self):
+        def one_node():
+            return {'nodes': {'node_1': dict(config.cluster['nodes']['node_1'])}}
+
+        def two_nodes():
+            return {'nodes': dict((k, dict(v)) for k, v in iteritems(config.cluster['nodes']))}
+
+        client = rediscluster.StrictRedisCluster(cluster=one_node(), db=4)
+        keys = ['k%d' % i for i in range(20)]
+        for key in keys:
+            client.set(key, key)
+        client.hset('h', 'f', 'v')
+
+        topology = client.topology
+        pipe = client.pipeline()
+        pipe.get(keys[0])
+        client.reload_topology(two_nodes())
+        # the topology is replaced as a whole, the pipeline keeps routing with the one it started with
+        self.assert_(client.topology is not topology)
+        self.assertEquals(topology.no_servers, 1)
+        self.assertEquals(client.no_servers, 2)
+        self.assert_(client.redises is client.topology.redises)
+        pipe.get(keys[1])
+        self.assertEquals(pipe.execute(), [b(keys[0]), b(keys[1])])
+        moved = [key for key in keys if client._getnodenamefor(key) == 'node_2']
+        self.assert_(moved)
+        # keys not migrated yet are read from their previous node
+        for key in keys:
+            self.assertEquals(client.get(key), b(key))
+        self.assertEquals(client.mget(keys + ['missing']), [b(key) for key in keys] + [None])
+        self.assertEquals(client.hgetall('h'), {b('f'): b('v')})
+        # writes go to the new nodes
+        client.set(moved[0], 'new')
+        self.assertEquals(client.get(moved[0]), b('new'))
+        # keys deleted or written during the migration are not read from their previous node
+        self.assertEquals(client.delete(moved[1]), 1)
+        self.assertEquals(client.get(moved[1]), None)
+        self.assertEquals(client.mget([moved[1]]), [None])
+        pipe = client.pipeline()
+        pipe.set(moved[2], 'new')
+        pipe.execute()
+        client.redises['node_2'].delete(moved[2])
+        self.assertEquals(client.get(moved[2]), None)
+        client.finish_migration()
+        self.assertEquals(client.get(moved[-1]), None)
+
+        # a key only stored on the second node
+        fresh = [key for key in ('f%d' % i for i in range(20)) if client._getnodenamefor(key) == 'node_2'][0]
+        client.set(fresh, 'fresh')
+
+        # configuration given by a callable
+        configs = [one_node()]
+        thread = client.watch_topology(lambda: configs[-1], interval=0.01)
+        for i in range(100):
+            if client.no_servers == 1:
+                break
+            time.sleep(0.01)
+        self.assertEquals(client.no_servers, 1)
+        self.assertEquals(client.get(moved[-1]), b(moved[-1]))
+        # the unchanged configuration is not reloaded, keeping the previous topology to read from
+        time.sleep(0.1)
+        self.assert_('slaves' not in configs[-1])
+        self.assertEquals(client.get(fresh), b('fresh'))
+        client.close()
+        thread.join()
+
+    def test_slot_table_reload(self):
+        import json
+        import os
+        import tempfile
+        from rediscluster.migrate import main
+
+        def nodes(n):
+            # the extra nodes are aliases of the first server
+            servers = config.cluster['nodes']
+            return {'nodes': dict(('node_%d' % i, dict(servers['node_%d' % min(i, 2)])) for i in range(1, n + 1))}
+
+        keys = ['key:%d' % i for i in range(2000)]
+        slots = {'node_1': [(8192, 16383)], 'node_2': [(0, 8191)]}
+        client = rediscluster.StrictRedisCluster(
+            cluster=dict(nodes(2), slots=slots), db=4, partitioner=rediscluster.SlotPartitioner)
+        self.assertEquals(client.partitioner.get_slots(), slots)
+        before = dict((key, client._getnodenamefor(key)) for key in keys)
+        # the slot table is kept, only the slots of the new node move
+        client.reload_topology(nodes(3))
+        self.assertEquals(client.partitioner.get_slots(),
+                          rediscluster.SlotPartitioner.rebalance(slots, ['node_1', 'node_2', 'node_3']))
+        moved = [key for key in keys if client._getnodenamefor(key) != before[key]]
+        self.assert_(len(moved) < len(keys) * 0.4)
+        self.assertEquals(set(client._getnodenamefor(key) for key in moved), set(['node_3']))
+        client.close()
+
+        # the migration writes the slot table of the new cluster for its clients
+        files = []
+        for cluster in (dict(nodes(2), slots=slots), nodes(3)):
+            fd, path = tempfile.mkstemp()
+            with os.fdopen(fd, 'w') as f:
+                json.dump(cluster, f)
+            files.append(path)
+        slots_out = tempfile.mktemp()
+        try:
+            self.assertEquals(main(['--old', files[0], '--new', files[1], '--db', '4', '--old-partitioner', 'slot',
+                                    '--new-partitioner', 'slot', '--slots-out', slots_out]), 0)
+            with open(slots_out) as f:
+                new_slots = json.load(f)
+            client = rediscluster.StrictRedisCluster(
+                cluster=dict(nodes(3), slots=new_slots), db=4, partitioner=rediscluster.SlotPartitioner)
+            self.assertEquals(client.partitioner.get_slots(),
+                              rediscluster.SlotPartitioner.rebalance(slots, ['node_1', 'node_2', 'node_3']))
+        finally:
+            for path in files + [slots_out]:
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def test_migrate(self):
+        import json
+        import os
+        import tempfile
+        from rediscluster.migrate import Migrator, main
+
+        one_node = {'nodes': {'node_1': dict(config.cluster['nodes']['node_1'])}}
+        two_nodes = {'nodes': dict((k, dict(v)) for k, v in iteritems(config.cluster['nodes']))}
+        checkpoint = tempfile.mktemp()
+        try:
+            for use_migrate in (True, False):
+                self.client.flushdb()
+                old = rediscluster.StrictRedisCluster(cluster=dict(one_node), db=4, mastersonly=True)
+                keys = ['k%d' % i for i in range(100)]
+                for key in keys:
+                    old.set(key, key)
+                old.rpush('list', 'a', 'b')
+                old.expire('list', 100)
+
+                stats = Migrator(dict(one_node), dict(two_nodes), db=4, batch_size=7, workers=3, rate=100000,
+                                 checkpoint=checkpoint, use_migrate=use_migrate).run()
+                new = rediscluster.StrictRedisCluster(cluster=dict(two_nodes), db=4, mastersonly=True)
+                moved = [key for key in keys + ['list'] if new._getnodenamefor(key) == 'node_2']
+                self.assertEquals(stats, {'scanned': 101, 'moved': len(moved), 'stray': 0, 'errors': 0})
+                self.assertEquals(new.mget(keys), [b(key) for key in keys])
+                self.assertEquals(new.lrange('list', 0, -1), [b('a'), b('b')])
+                self.assert_(0 < new.ttl('list') <= 100)
+                self.assertEquals(old.dbsize(), 101 - len(moved))
+                with open(checkpoint) as f:
+                    self.assertEquals(list(json.load(f).values()), ['done'])
+                # resuming a finished migration does nothing
+                self.assertEquals(Migrator(dict(one_node), dict(two_nodes), db=4, checkpoint=checkpoint).run()['scanned'], 0)
+                os.remove(checkpoint)
+
+            files = []
+            for cluster in (one_node, two_nodes):
+                fd, path = tempfile.mkstemp()
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(cluster, f)
+                files.append(path)
+            self.assertEquals(main(['--old', files[1], '--new', files[0], '--db', '4']), 0)
+            self.assertEquals(old.dbsize(), 101)
+            for path in files:
+                os.remove(path)
+        finally:
+            if os.path.exists(checkpoint):
+                os.remove(checkpoint)
+
+    def test_migrate_errors(self):
+        import json
+        import os
+        import tempfile
+        from rediscluster.migrate import Migrator
+
+        one_node = {'nodes': {'node_1': dict(config.cluster['nodes']['node_1'])}}
+        two_nodes = {'nodes': dict((k, dict(v)) for k, v in iteritems(config.cluster['nodes']))}
+        checkpoint = tempfile.mktemp()
+        try:
+            for use_migrate in (True, False):
+                self.client.flushdb()
+                old = rediscluster.StrictRedisCluster(cluster=dict(one_node), db=4, mastersonly=True)
+                new = rediscluster.StrictRedisCluster(cluster=dict(two_nodes), db=4, mastersonly=True)
+                keys = ['k%d' % i for i in range(20)]
+                for key in keys:
+                    old.set(key, key)
+                moved = [key for key in keys if new._getnodenamefor(key) == 'node_2']
+                # keys already on their new node are not overwritten without replace
+                for key in moved[:2]:
+                    new.set(key, 'busy')
+
+                stats = Migrator(dict(one_node), dict(two_nodes), db=4, batch_size=5,
+                                 checkpoint=checkpoint, use_migrate=use_migrate).run()
+                self.assertEquals(stats, {'scanned': 20, 'moved': len(moved) - 2, 'stray': 0, 'errors': 2})
+                self.assertEquals(new.mget(moved), [b('busy')] * 2 + [b(key) for key in moved[2:]])
+                self.assertEquals(sorted(old.keys()), sorted(b(key) for key in keys if key not in moved[2:]))
+                with open(checkpoint) as f:
+                    self.assertEquals(list(json.load(f).values()), [0])
+
+                stats = Migrator(dict(one_node), dict(two_nodes), db=4, checkpoint=checkpoint,
+                                 use_migrate=use_migrate, replace=True).run()
+                self.assertEquals(stats['moved'], 2)
+                self.assertEquals(stats['errors'], 0)
+                self.assertEquals(new.mget(keys), [b(key) for key in keys])
+                with open(checkpoint) as f:
+                    self.assertEquals(list(json.load(f).values()), ['done'])
+                os.remove(checkpoint)
+        finally:
+            if os.path.exists(checkpoint):
+                os.remove(checkpoint)
+
+    def test_migrate_stray(self):
+        import json
+        import os
+        import tempfile
+        from rediscluster.migrate import Migrator, main
+
+        one_node = {'nodes': {'node_1': dict(config.cluster['nodes']['node_1'])}}
+        two_nodes = {'nodes': dict((k, dict(v)) for k, v in iteritems(config.cluster['nodes']))}
+        self.client.flushdb()
+        old = rediscluster.StrictRedisCluster(cluster=dict(two_nodes), db=4, mastersonly=True)
+        # stored as "k<i>" on the node of their hash tag
+        for i in range(30):
+            old.set('k%d{t%d}' % (i, i), i)
+        stray = [i for i in range(30) if old._getnodenamefor('k%d' % i) != old._getnodenamefor('t%d' % i)]
+        self.assert_(stray)
+
+        stats = Migrator(dict(two_nodes), dict(one_node), db=4).run()
+        self.assertEquals(stats['stray'], len(stray))
+        self.assertEquals(stats['errors'], 0)
+        # the stray keys are left where their hash tag routes them
+        self.assertEquals([old.get('k%d{t%d}' % (i, i)) for i in stray], [b(str(i)) for i in stray])
+
+        files = []
+        for cluster in (two_nodes, one_node):
+            fd, path = tempfile.mkstemp()
+            with os.fdopen(fd, 'w') as f:
+                json.dump(cluster, f)
+            files.append(path)
+        try:
+            self.assertEquals(main(['--old', files[0], '--new', files[1], '--db', '4']), 1)
+        finally:
+            for path in files:
+                os.remove(path)
+
     def test_get_and_set(self):
         # get and set can't be tested independently of each other
         client = self.get_client()
@@ -95,16 +747,31 @@ class ClusterCommandsTestCase(unittest.TestCase):
         self.assertEquals(self.client.delete('a'), True)
 
     def test_delete_multiple_keys(self):
-        try:
-            raise unittest.SkipTest()
-        except AttributeError:
-            return
         self.client['a'] = 'foo'
         self.client['b'] = 'bar'
         self.assertEquals(self.client.delete('a', 'b'), 2)
         self.assertEquals(self.client.get('a'), None)
         self.assertEquals(self.client.get('b'), None)
 
+    def test_delete_many_nodes(self):
+        client = self.get_client(chunk_size=3)
+        keys = ['k%d' % i for i in range(50)] + ['t%d{k1}' % i for i in range(5)]
+        for key in keys:
+            client.set(key, key)
+        self.assert_(len(client._getaliasesfor('delete', keys)) > 1)
+        self.assertEquals(client.delete(*(keys[:20] + ['missing'])), 20)
+        self.assertEquals(client.mget(keys[:20]), [None] * 20)
+        self.assertEquals(client.unlink(*keys[20:]), len(keys) - 20)
+        self.assertEquals(client.dbsize(), 0)
+
+        client = self.get_client(mastersonly=True)
+        for key in keys:
+            client.set(key, key)
+        pipe = client.pipeline()
+        pipe.delete(*keys[:20]).get(keys[20]).unlink(*(keys[20:] + ['missing']))
+        self.assertEquals(pipe.execute(), [20, b(keys[20]), len(keys) - 20])
+        self.assertEquals(client.dbsize(), 0)
+
     def test_delitem(self):
         self.client['a'] = 'foo'
         del self.client['a']
@@ -210,6 +877,79 @@ class ClusterCommandsTestCase(unittest.TestCase):
         for data in itervalues(self.client.ping()):
             self.assertEquals(data, True)
 
+    def test_admin_partial_results(self):
+        client = self.get_client()
+        alias = sorted(client.redises)[0]
+        client.redises[alias] = redis.StrictRedis(host='127.0.0.1', port=1)
+        replies = client.ping()
+        self.assert_(isinstance(replies[alias], rediscluster.ConnectionError))
+        for k, v in iteritems(replies):
+            if k != alias and client.redises[k] is not client.redises[alias]:
+                self.assertEquals(v, True)
+
+    def test_admin_node_timeout(self):
+        class SlowNode(object):
+            def ping(self):
+                time.sleep(1)
+                return True
+
+        client = self.get_client(node_timeout=0.2, max_workers=2)
+        alias = sorted(client.redises)[0]
+        client.redises[alias] = SlowNode()
+        start = time.time()
+        replies = client.ping()
+        self.assert_(time.time() - start < 1)
+        self.assert_(isinstance(replies[alias], rediscluster.ConnectionError))
+
+    def test_hung_node_timeout(self):
+        import socket
+        # accepts the connections but never replies
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        server.listen(16)
+        try:
+            client = self.get_client(node_timeout=0.3, max_workers=4, mastersonly=True)
+            hung = client._redis(4, {'host': '127.0.0.1', 'port': server.getsockname()[1]})
+            self.assertEquals(hung.connection_pool.connection_kwargs['socket_timeout'], 0.3)
+            client.redises['node_2'] = client.redises['node_2_slave'] = hung
+            for i in range(6):
+                replies = client.ping()
+                self.assert_(isinstance(replies['node_2'], redis.RedisError))
+            # the threads of the calls timed out are not held by the hung server
+            time.sleep(0.1)
+            self.assertEquals(client.ping()['node_1'], True)
+            key = [key for key in ('k%d' % i for i in range(20)) if client._getnodenamefor(key) == 'node_2'][0]
+            start = time.time()
+            self.assertRaises(redis.RedisError, client.get, key)
+            self.assert_(time.time() - start < 1)
+            client.close()
+        finally:
+            server.close()
+
+    def test_worker_pool(self):
+        from rediscluster.workers import WorkerPool
+        client = self.get_client(max_workers=2)
+        keys = ['k%d' % i for i in range(20)]
+        client.mset(dict((key, key) for key in keys))
+        threads = threading.active_count()
+        for i in range(5):
+            self.assertEquals(client.mget(keys), [b(key) for key in keys])
+            client.ping()
+        # the threads of the client are kept and bounded
+        self.assertEquals(len(client._workers), 2)
+        self.assertEquals(threading.active_count(), threads)
+
+        # calls submitted from a thread of the pool run at once on it
+        pool = WorkerPool(max_workers=1)
+        done = threading.Event()
+        pool.submit(pool.submit, done.set)
+        self.assert_(done.wait(1))
+        pool.close()
+        self.assertEquals(len(pool), 0)
+        client.close()
+        self.assertEquals(client.mget(keys[:3]), [b(key) for key in keys[:3]])
+        client.close()
+
     def test_time(self):
         for info in itervalues(self.client.info()):
             version = info['redis_version']
@@ -504,6 +1244,32 @@ class ClusterCommandsTestCase(unittest.TestCase):
             keys - set([b('testc')]))
         self.assertEquals(set(self.client.keys(pattern='test*')), keys)
 
+    def test_scan_iter(self):
+        self.assertEquals(list(self.client.scan_iter()), [])
+        keys = set([b('k%d' % i) for i in range(100)])
+        for key in keys:
+            self.client[key] = 1
+        self.client.rpush('l', 'a1')
+        self.assertEquals(set(self.client.scan_iter(match='k*', count=10)), keys)
+        self.assertEquals(
+            set(self.client.scan_iter(match='k*', count=10, parallel=True)), keys)
+        self.assertEquals(len(list(self.client.scan_iter())), 101)
+
+        for info in itervalues(self.client.info()):
+            if StrictVersion(info['redis_version']) < StrictVersion('6.0.0'):
+                return
+        self.assertEquals(list(self.client.scan_iter(type='list')), [b('l')])
+
+    def test_scan_resume(self):
+        keys = set([b('k%d' % i) for i in range(100)])
+        for key in keys:
+            self.client[key] = 1
+        cursor, found = self.client.scan(count=10)
+        self.assertNotEquals(cursor, '0')
+        # another client can carry on from the cursor
+        found.extend(self.get_client().scan_iter(cursor=cursor, count=10))
+        self.assertEquals(set(found), keys)
+
     def test_mget(self):
         self.assertEquals(self.client.mget(['a', 'b']), [None, None])
         self.client['a'] = '1'
@@ -522,6 +1288,15 @@ class ClusterCommandsTestCase(unittest.TestCase):
             self.client.mget(['foo{foo}', 'c', 'bar', 'other']),
             [b('1'), None, b('2'), b('3')])
 
+    def test_mget_many_nodes(self):
+        keys = ['k%d' % i for i in range(50)]
+        for i, k in enumerate(keys):
+            self.client[k] = i
+        self.client['bar{foo}'] = 'bar'
+        self.assertEquals(
+            self.client.mget(keys[:25] + ['bar{foo}', 'missing'] + keys[25:]),
+            [b(str(i)) for i in range(25)] + [b('bar'), None] + [b(str(i)) for i in range(25, 50)])
+
     def test_mset(self):
         d = {'a': '1', 'b': '2', 'c': '3'}
         self.assert_(self.client.mset(d))
@@ -546,6 +1321,16 @@ class ClusterCommandsTestCase(unittest.TestCase):
             self.assertEquals(self.client[k], b(v))
         self.assertEquals(self.client.get('d'), None)
 
+    def test_mset_msetnx_many_nodes(self):
+        d = dict(('k%d' % i, str(i)) for i in range(50))
+        self.assert_(self.client.msetnx(d))
+        self.assertEquals(
+            self.client.mget(sorted(d)), [b(d[k]) for k in sorted(d)])
+        self.assert_(not self.client.msetnx({'k49': 'x', 'new': 'x'}))
+        self.assertEquals(self.client.get('new'), None)
+        self.assert_(self.client.mset(dict((k, 'x') for k in d)))
+        self.assertEquals(self.client.mget(sorted(d)), [b('x')] * len(d))
+
     def test_randomkey(self):
         # CLUSTER
         try:
@@ -564,6 +1349,69 @@ class ClusterCommandsTestCase(unittest.TestCase):
         self.assertEquals(self.client.get('a'), None)
         self.assertEquals(self.client['b'], b('1'))
 
+    def test_rename_same_node(self):
+        client = self.get_client(mastersonly=True)
+        node = client._getnodenamefor('k0')
+        src, dst, other = [key for key in ('k%d' % i for i in range(20)) if client._getnodenamefor(key) == node][:3]
+        client.set(src, 'foo')
+        client.set(other, 'bar')
+        client.redises[node].config_resetstat()
+        self.assert_(client.rename(src, dst))
+        self.assert_(not client.renamenx(dst, other))
+        stats = client.redises[node].info('commandstats')
+        self.assertEquals(stats['cmdstat_rename']['calls'], 1)
+        self.assertEquals(stats['cmdstat_renamenx']['calls'], 1)
+        self.assert_('cmdstat_dump' not in stats)
+        self.assertEquals(client.get(dst), b('foo'))
+        self.assertRaises(rediscluster.ResponseError, client.rename, src, dst)
+
+    def test_rename_restore_error(self):
+        class NoRestore(redis.StrictRedis):
+            def execute_command(self, *args, **options):
+                if args[0] == 'RESTORE':
+                    raise redis.ResponseError('DUMP payload version or checksum are wrong')
+                return super(NoRestore, self).execute_command(*args, **options)
+
+        client = self.get_client(mastersonly=True)
+        keys = ['k%d' % i for i in range(20)]
+        src = [key for key in keys if client._getnodenamefor(key) == 'node_1'][0]
+        dst = [key for key in keys if client._getnodenamefor(key) == 'node_2'][0]
+        client.rpush(src, '1', '2')
+        client.set(dst, 'old')
+        client.redises['node_2'] = NoRestore(connection_pool=client.redises['node_2'].connection_pool)
+        # copied by type when the payload can't be restored
+        self.assert_(client.rename(src, dst))
+        self.assertEquals(client.lrange(dst, 0, -1), [b('1'), b('2')])
+        self.assertEquals(client.exists(src), False)
+
+    def test_rename_types(self):
+        client = self.get_client(mastersonly=True, chunk_size=2)
+        for rename in (client.rename,
+                       lambda src, dst: client._rename_by_type(
+                           client.redises[client._getnodenamefor(src)], src,
+                           client.redises[client._getnodenamefor(dst)], dst)):
+            client.flushdb()
+            client.set('a', 'foo')
+            client.hmset('b', {'f1': '1', 'f2': '2', 'f3': '3'})
+            client.rpush('c', '1', '2', '3', '1', '2')
+            client.sadd('d', '1', '2', '3')
+            client.zadd('e', 1, 'a', 2, 'b', 3.5, 'c')
+            client.expire('e', 100)
+            client.set('f', 'overwritten')
+            for src in ('a', 'b', 'c', 'd', 'e'):
+                dst = src + 'f' if src != 'a' else 'f'
+                self.assert_(rename(src, dst))
+                self.assertEquals(client.exists(src), False)
+            self.assertEquals(client.get('f'), b('foo'))
+            self.assertEquals(client.hgetall('bf'), {b('f1'): b('1'), b('f2'): b('2'), b('f3'): b('3')})
+            self.assertEquals(client.lrange('cf', 0, -1), [b('1'), b('2'), b('3'), b('1'), b('2')])
+            self.assertEquals(client.smembers('df'), set([b('1'), b('2'), b('3')]))
+            self.assertEquals(
+                client.zrange('ef', 0, -1, withscores=True), [(b('a'), 1), (b('b'), 2), (b('c'), 3.5)])
+            self.assert_(0 < client.ttl('ef') <= 100)
+            self.assertEquals(client.ttl('df'), -1)
+        self.assertRaises(rediscluster.ResponseError, client.rename, 'missing', 'a')
+
     def test_renamenx(self):
         self.client['a'] = '1'
         self.client['b'] = '2'
@@ -1067,6 +1915,73 @@ class ClusterCommandsTestCase(unittest.TestCase):
             self.client.sinter(['a', 'b']),
             set([b('a1'), b('a3')]))
 
+    def test_set_algebra_many_nodes(self):
+        client = self.get_client(mastersonly=True)
+        keys = ['s%d' % i for i in range(8)]
+        for i, key in enumerate(keys):
+            client.sadd(key, 'all', *['m%d' % j for j in range(i, 20 + i * 10)])
+        members = [client.smembers(key) for key in keys]
+        self.assert_(len(client._getaliasesfor('sinter', keys)) > 1)
+        self.assertEquals(client.sinter(keys), set.intersection(*members))
+        # only the smallest set is fetched, the others answer SISMEMBER
+        servers = dict((client.redises[alias].connection_pool.connection_kwargs['port'],
+                        client.redises[alias]) for alias in client.cluster['nodes'])
+        for redisent in servers.values():
+            redisent.config_resetstat()
+        client.sinter(keys)
+        calls = [redisent.info('commandstats').get('cmdstat_smembers', {}).get('calls', 0)
+                 for redisent in servers.values()]
+        self.assertEquals(sum(calls), 1)
+        self.assertEquals(client.sunion(keys), set.union(*members))
+        self.assertEquals(client.sdiff(keys[::-1]), members[-1].difference(*members[:-1]))
+        self.assertEquals(client.sinter(keys + ['missing']), set())
+        # keys landing on the same node use the native command
+        colocated = [key for key in keys if client.getnodefor(key) == client.getnodefor(keys[0])]
+        self.assertEquals(len(client._getaliasesfor('sinter', colocated)), 1)
+        self.assertEquals(client.sinter(colocated), set.intersection(*[members[keys.index(k)] for k in colocated]))
+        self.assertEquals(client.sinter('s1{a}', 's2{a}'), set())
+        # membership checks are pipelined chunk_size commands at a time
+        client = self.get_client(mastersonly=True, chunk_size=3)
+        self.assertEquals(client._ismember(keys[:2], ['all', 'm0', 'm1', 'nope']),
+                          [[True, True], [True, False], [True, True], [False, False]])
+        self.assertEquals(client.sinter(keys), set.intersection(*members))
+
+    def test_set_store_streaming(self):
+        client = self.get_client(mastersonly=True, chunk_size=3, buffer_size=5)
+        keys = ['s%d' % i for i in range(6)]
+        for i, key in enumerate(keys):
+            client.sadd(key, 'all', *['m%d' % j for j in range(i, 20 + i * 10)])
+        members = [client.smembers(key) for key in keys]
+        self.assertEquals(client.sunionstore('dst', keys), len(set.union(*members)))
+        self.assertEquals(client.smembers('dst'), set.union(*members))
+        self.assertEquals(client.sinterstore('dst', keys), len(set.intersection(*members)))
+        self.assertEquals(client.smembers('dst'), set.intersection(*members))
+        diff = members[-1].difference(*members[:-1])
+        self.assertEquals(client.sdiffstore('dst', keys[::-1]), len(diff))
+        self.assertEquals(client.smembers('dst'), diff)
+        # the destination can be one of the sources
+        self.assertEquals(client.sunionstore('s0', keys[:2]), len(members[0] | members[1]))
+        self.assertEquals(client.smembers('s0'), members[0] | members[1])
+        self.assertEquals(client.sinterstore('dst', keys + ['missing']), 0)
+        self.assertEquals(client.exists('dst'), False)
+        self.assertEquals(len(client.keys('rediscluster:store:*')), 0)
+
+        # the temporary key expires, and is deleted when the store fails
+        ttls = []
+
+        def batches():
+            for i in range(3):
+                yield ['m%d' % j for j in range(i * 5, i * 5 + 5)]
+            for alias, redisent in iteritems(client._masters()):
+                ttls.extend(redisent.pttl(key) for key in redisent.keys('rediscluster:store:*'))
+            raise ValueError()
+        self.assertRaises(ValueError, client._store, 'dst', batches())
+        self.assertEquals(len(ttls), 1)
+        self.assert_(0 < ttls[0] <= 600000)
+        self.assertEquals(len(client.keys('rediscluster:store:*')), 0)
+        self.assertEquals(client.sunionstore('dst', keys), len(set.union(*members)))
+        self.assertEquals(client.ttl('dst'), -1)
+
     def test_sinterstore(self):
         # some key is not a set
         self.make_set('a', ['a1', 'a2', 'a3'])
@@ -1260,11 +2175,6 @@ class ClusterCommandsTestCase(unittest.TestCase):
         self.assertEquals(self.client.zscore('a', 'a3'), 8.0)
 
     def test_zinterstore(self):
-        # CLUSTER
-        try:
-            raise unittest.SkipTest()
-        except AttributeError:
-            return
         self.make_zset('a', {'a1': 1, 'a2': 1, 'a3': 1})
         self.make_zset('b', {'a1': 2, 'a3': 2, 'a4': 2})
         self.make_zset('c', {'a1': 6, 'a3': 5, 'a4': 4})
@@ -1292,6 +2202,35 @@ class ClusterCommandsTestCase(unittest.TestCase):
             [(b('a3'), 20), (b('a1'), 23)]
         )
 
+    def test_zstore_many_nodes(self):
+        client = self.get_client(mastersonly=True, chunk_size=3, buffer_size=4)
+        keys = ['z%d' % i for i in range(6)]
+        zsets = []
+        for i, key in enumerate(keys):
+            zset = dict(('m%d' % j, j * (i + 1)) for j in range(i, 10 + i * 3))
+            client.zadd(key, **zset)
+            zsets.append(zset)
+        self.assert_(len(client._getaliasesfor('zunionstore', ['dst'] + keys)) > 1)
+        weights = dict((key, i + 1) for i, key in enumerate(keys))
+
+        union = {}
+        for zset, key in zip(zsets, keys):
+            for member, score in iteritems(zset):
+                union[member] = max(union.get(member, score), score * weights[key])
+        self.assertEquals(client.zunionstore('dst', weights, aggregate='max'), len(union))
+        self.assertEquals(client.zrange('dst', 0, -1, withscores=True),
+                          sorted(((b(k), v) for k, v in iteritems(union)), key=lambda x: (x[1], x[0])))
+
+        inter = dict((member, sum(zset[member] for zset in zsets))
+                     for member in zsets[0] if all(member in zset for zset in zsets))
+        self.assert_(inter)
+        self.assertEquals(client.zinterstore('dst', keys), len(inter))
+        self.assertEquals(dict(client.zrange('dst', 0, -1, withscores=True)),
+                          dict((b(k), v) for k, v in iteritems(inter)))
+        self.assertEquals(client.zinterstore('dst', keys + ['missing']), 0)
+        self.assertEquals(client.exists('dst'), False)
+        self.assertRaises(rediscluster.DataError, client.zunionstore, 'dst', keys, aggregate='AVG')
+
     def test_zrange(self):
         # key is not a zset
         self.client['a'] = 'a'
@@ -1465,11 +2404,6 @@ class ClusterCommandsTestCase(unittest.TestCase):
         self.assertEquals(self.client.zscore('a', 'a4'), None)
 
     def test_zunionstore(self):
-        # CLUSTER
-        try:
-            raise unittest.SkipTest()
-        except AttributeError:
-            return
         self.make_zset('a', {'a1': 1, 'a2': 1, 'a3': 1})
         self.make_zset('b', {'a1': 2, 'a3': 2, 'a4': 2})
         self.make_zset('c', {'a1': 6, 'a4': 5, 'a5': 4})
@@ -1978,6 +2912,163 @@ class ClusterCommandsTestCase(unittest.TestCase):
         self.assertEquals(client.persist('a'), True)
         self.assertEquals(client.pttl('a'), -1)
 
+    # SCRIPTING
+    def test_eval(self):
+        self.client['a{foo}'] = 2
+        script = "return redis.call('INCRBY', KEYS[1], ARGV[1]) + redis.call('INCR', KEYS[2])"
+        self.assertEquals(self.client.eval(script, 2, 'a{foo}', 'b{foo}', 3), 6)
+        sha = self.client.script_load(script)
+        self.assertEquals(self.client.script_exists(sha, 'f' * 40), [True, False])
+        self.assertEquals(self.client.evalsha(sha, 2, 'a{foo}', 'b{foo}', 3), 10)
+        self.assertEquals(self.client.get('a{foo}'), b('8'))
+        self.assertEquals(self.client.get('b'), b('2'))
+
+        other = [key for key in ('k%d' % i for i in range(20))
+                 if self.client.getnodefor(key) != self.client.getnodefor('foo')][0]
+        self.assertRaises(rediscluster.DataError, self.client.eval, script, 2, 'a{foo}', other, 1)
+        self.assertRaises(rediscluster.DataError, self.client.eval, "return 1", 0)
+        self.assertRaises(rediscluster.DataError, self.client.pipeline().eval, script, 1, 'a', 1)
+
+    def test_register_script(self):
+        self.client.script_flush()
+        multiply = self.client.register_script("return (tonumber(redis.call('GET', KEYS[1])) or 0) * ARGV[1]")
+        nodes = set()
+        for i in range(10):
+            key = 'k%d' % i
+            self.client[key] = i
+            self.assertEquals(multiply(keys=[key], args=[3]), i * 3)
+            nodes.add(self.client._getnodenamefor(key))
+        self.assertEquals(len(nodes), 2)
+        self.assertEquals(self.client.script_exists(multiply.sha), [True])
+        self.assertEquals(sorted(self.client._script_shas), sorted(nodes))
+
+        # reloaded transparently once flushed behind the back of the client
+        for node in nodes:
+            self.client.redises[node].script_flush()
+        self.assertEquals(multiply(keys=['k2'], args=[5]), 10)
+        self.assertEquals(multiply(keys=['a{k2}'], args=[5], client=self.client), 0)
+
+        self.client.script_flush()
+        self.assertEquals(self.client.script_exists(multiply.sha), [False])
+        self.assertEquals(self.client._script_shas, {})
+        self.assertEquals(self.client.script_load(multiply.script), multiply.sha)
+        self.assertEquals(self.client.script_exists(multiply.sha), [True])
+
+    # PIPELINE
+    def test_pipeline(self):
+        pipe = self.client.pipeline()
+        keys = ['a', 'b', 'c', 'd', 'e', 'f']
+        for i, k in enumerate(keys):
+            pipe.set(k, i)
+        pipe.incr('a').rpush('l', 'a1', 'a2')
+        self.assertEquals(len(pipe), len(keys) + 2)
+        self.assertEquals(pipe.execute(), [True] * len(keys) + [1, 2])
+        self.assertEquals(len(pipe), 0)
+
+        with self.get_client(mastersonly=True).pipeline() as pipe:
+            for k in keys:
+                pipe.get(k)
+            pipe.lrange('l', 0, -1)
+            self.assertEquals(
+                pipe.execute(),
+                [b('1'), b('1'), b('2'), b('3'), b('4'), b('5'), [b('a1'), b('a2')]])
+
+    def test_pipeline_hash_tag(self):
+        pipe = self.client.pipeline()
+        pipe.set('a{foo}', 'a').set('b{foo}', 'b').mget(['a{foo}', 'b'])
+        self.assertEquals(pipe.execute(), [True, True, [b('a'), b('b')]])
+
+    def test_pipeline_errors(self):
+        pipe = self.client.pipeline()
+        self.assertRaises(rediscluster.DataError, pipe.mget, ['a', 'b'])
+        self.assertRaises(rediscluster.DataError, pipe.keys)
+        self.assertEquals(pipe.execute(), [])
+
+        self.client['a'] = 'foo'
+        pipe.set('b', 1).lpush('a', 'a1').incr('b')
+        res = pipe.execute(raise_on_error=False)
+        self.assertEquals(res[0], True)
+        self.assert_(isinstance(res[1], rediscluster.ResponseError))
+        self.assertEquals(res[2], 2)
+
+        # every command is sent before the first error is raised
+        other = [key for key in ('k%d' % i for i in range(20))
+                 if self.client.getnodefor(key) != self.client.getnodefor('a')][:2]
+        pipe.set(other[0], 1).lpush('a', 'a1').set(other[1], 1).set('c{a}', 1)
+        self.assertRaises(rediscluster.ResponseError, pipe.execute)
+        self.assertEquals(len(pipe), 0)
+        self.assertEquals(self.client.mget(other + ['c{a}']), [b('1')] * 3)
+
+    def test_transaction(self):
+        with self.client.pipeline(transaction=True) as pipe:
+            pipe.set('a{foo}', 1).incr('b{foo}').mget(['a{foo}', 'b']).delete('a{foo}', 'c{foo}')
+            self.assertEquals(len(pipe), 4)
+            self.assertEquals(pipe.execute(), [True, 1, [b('1'), b('1')], 1])
+            self.assertEquals(len(pipe), 0)
+        node = self.client.getnodefor('foo')
+        self.assertEquals(self.client.getnodefor('b'), node)
+        self.assertEquals(self.client.get('b'), b('1'))
+        self.assertEquals(self.client.get('a'), None)
+
+        # the keys can land to the same node without hash tags
+        keys = [key for key in ('k%d' % i for i in range(20)) if self.client.getnodefor(key) == node][:2]
+        self.assertEquals(self.client.pipeline(transaction=True).set(keys[0], 1).set(keys[1], 2).execute(), [True, True])
+
+        # the whole transaction fails on a command error
+        pipe = self.client.pipeline(transaction=True)
+        pipe.set('l{foo}', 'x').lpush('l{foo}', 'a').set('m{foo}', 'y')
+        res = pipe.execute(raise_on_error=False)
+        self.assertEquals(res[0], True)
+        self.assert_(isinstance(res[1], rediscluster.ResponseError))
+        self.assertEquals(res[2], True)
+
+    def test_transaction_errors(self):
+        other = [key for key in ('k%d' % i for i in range(20))
+                 if self.client.getnodefor(key) != self.client.getnodefor('foo')][0]
+        pipe = self.client.pipeline(transaction=True)
+        pipe.set('a{foo}', 1)
+        self.assertRaises(rediscluster.DataError, pipe.set, other, 1)
+        self.assertRaises(rediscluster.DataError, pipe.delete, 'b{foo}', other)
+        self.assertRaises(rediscluster.DataError, pipe.watch, other)
+        self.assertRaises(rediscluster.DataError, pipe.mget, ['a', 'b'])
+        self.assertRaises(rediscluster.DataError, pipe.keys)
+        self.assertRaises(rediscluster.DataError, pipe.exec)
+        self.assertEquals(pipe.execute(), [True])
+        self.assertEquals(self.client.get(other), None)
+        self.assertEquals(pipe.execute(), [])
+
+    def test_transaction_watch(self):
+        self.client['a{foo}'] = 1
+        with self.client.pipeline(transaction=True) as pipe:
+            pipe.watch('a{foo}', 'b{foo}')
+            # executed right away until multi
+            self.assertEquals(pipe.get('a{foo}'), b('1'))
+            pipe.multi()
+            pipe.incr('a{foo}')
+            self.client.set('b{foo}', 'changed')
+            self.assertRaises(rediscluster.WatchError, pipe.execute)
+            self.assertEquals(self.client.get('a{foo}'), b('1'))
+
+            pipe.watch('a{foo}')
+            pipe.multi()
+            pipe.incr('a{foo}')
+            self.assertEquals(pipe.execute(), [2])
+
+        calls = []
+
+        def incr(pipe):
+            value = int(pipe.get('a{foo}'))
+            if not calls:
+                self.client.set('a{foo}', value)
+            calls.append(value)
+            pipe.multi()
+            pipe.set('a{foo}', value * 10)
+            return value
+
+        self.assertEquals(self.client.transaction(incr, 'a{foo}', value_from_callable=True), 2)
+        self.assertEquals(len(calls), 2)
+        self.assertEquals(self.client.get('a{foo}'), b('20'))
+
     # # BINARY SAFE
     # TODO add more tests
     def test_binary_get_set(self):